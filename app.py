@@ -3,41 +3,83 @@ import os
 from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
-from aws.sqs import poll_sqs
+from aws.consumer_election import consumer_election
+from aws.sqs import SQS_CONSUMER_ENABLED, consumer_health, consumer_stats, poll_sqs
 from config import load_environment
-from db.database import init_db, insert_static, insert_test_data
+from db.database import (
+  DB_READ_PIN_SECONDS,
+  database_health,
+  dispose_engines,
+  init_db,
+  insert_static,
+  insert_test_data,
+  pin_reads_after_writes,
+  pool_stats,
+  read_engine,
+  read_routing
+)
+from db.slow_queries import slow_query_log
+from metrics import HEALTHY, monitor_event_loop, record_request_metrics, render_metrics
+from profiling import PROFILING_ENABLED, profile_requests
+from repository.change_bus import change_bus
+from repository.queue_broker import queue_broker
+from repository.queue_cache import queue_cache
+from repository.static_cache import static_cache
 from routes import config, queue
 
 load_environment()
 
 ENVIRONMENT = os.getenv("ENVIRONMENT", "prod")
+# Port and worker processes of `python app.py`
+PORT = int(os.getenv("PORT", "5000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Set by `serve` for its workers once the schema check and seeding are done
+STARTUP_PREPARED = os.getenv("STARTUP_PREPARED", "false").lower() == "true"
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-  """Startup and shutdown event handler"""
-
-  # Initialize the database at startup
+async def prepare_database():
+  """One-time startup work: check (or migrate) the schema and seed the static and test data"""
   await init_db()
   await insert_static()
 
   if ENVIRONMENT == "local":
     await insert_test_data()
 
-  # Start polling SQS for new messages asynchronously
-  task_poll_sqs = asyncio.create_task(poll_sqs())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  """Startup and shutdown event handler"""
+
+  # Initialize the database at startup, unless `serve` already did before starting the workers
+  if not STARTUP_PREPARED:
+    await prepare_database()
+  await static_cache.load()
+
+  # Share committed changes with the other workers
+  await change_bus.start()
+
+  tasks = [asyncio.create_task(monitor_event_loop())]
+
+  # Poll SQS for new messages asynchronously while this worker is elected as a consumer
+  if SQS_CONSUMER_ENABLED:
+    app.state.consumer_task = asyncio.create_task(consumer_election.run(poll_sqs))
+    tasks.append(app.state.consumer_task)
 
   yield
 
-  # Clean up the background SQS polling when shutting down
-  task_poll_sqs.cancel()
-  try:
-    await task_poll_sqs
-  except asyncio.CancelledError:
-    pass
+  # Clean up the background tasks when shutting down
+  for task in tasks:
+    task.cancel()
+    try:
+      await task
+    except asyncio.CancelledError:
+      pass
+
+  await change_bus.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -50,14 +92,59 @@ app.add_middleware(
   allow_headers=["*"],
 )
 
+# Read-your-writes for clients of the read replica
+if read_engine is not None and DB_READ_PIN_SECONDS > 0:
+  app.middleware("http")(pin_reads_after_writes)
+
+app.middleware("http")(record_request_metrics)
+
+# Opt-in request profiling (PROFILE_SAMPLE_RATE or PROFILE_TOKEN)
+if PROFILING_ENABLED:
+  app.middleware("http")(profile_requests)
+
 router = APIRouter(prefix="/queue-mgr")
 
 
 # Health check endpoint
 @router.get("/health", tags=["System"])
 async def health_check():
-  """Health check endpoint for monitoring service status."""
-  return {"status": "healthy"}
+  """Health check endpoint for monitoring service status; 503 when the database or the consumer is unhealthy."""
+  checks = {
+    "database": await database_health(),
+    "consumer": consumer_health(getattr(app.state, "consumer_task", None)),
+  }
+  for component, check in checks.items():
+    HEALTHY.labels(component).set(int(check["healthy"]))
+
+  healthy = all(check["healthy"] for check in checks.values())
+  return JSONResponse(
+    {"status": "healthy" if healthy else "degraded", "checks": checks},
+    status_code=200 if healthy else 503
+  )
+
+
+# Prometheus metrics endpoint
+@router.get("/metrics", tags=["System"])
+async def metrics():
+  """Request, database, consumer and event loop metrics in the Prometheus text format."""
+  body, content_type = render_metrics()
+  return Response(body, media_type=content_type)
+
+
+# Runtime statistics endpoint
+@router.get("/stats", tags=["System"])
+async def runtime_stats():
+  """Runtime statistics of background components."""
+  return {
+    "consumer": consumer_stats(),
+    "dbPool": pool_stats(),
+    "dbRead": read_routing.stats(),
+    "slowQueries": slow_query_log.stats(),
+    "staticCache": static_cache.stats(),
+    "queueCache": queue_cache.stats(),
+    "queueStream": queue_broker.stats(),
+    "changeBus": change_bus.stats(),
+  }
 
 
 # Other routes
@@ -66,5 +153,23 @@ router.include_router(queue.router, prefix="/queue", tags=["Queue"])
 
 app.include_router(router)
 
+
+def serve(host: str = "0.0.0.0", port: int = PORT):
+  """Run the app in WEB_CONCURRENCY worker processes, preparing the database once before they start"""
+  if WEB_CONCURRENCY <= 1:
+    uvicorn.run("app:app", host=host, port=port)
+    return
+
+  async def prepare():
+    try:
+      await prepare_database()
+    finally:
+      await dispose_engines()
+
+  asyncio.run(prepare())
+  os.environ["STARTUP_PREPARED"] = "true"
+  uvicorn.run("app:app", host=host, port=port, workers=WEB_CONCURRENCY)
+
+
 if __name__ == "__main__":
-  uvicorn.run("app:app", host="0.0.0.0", port=5000)
+  serve()
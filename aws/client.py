@@ -0,0 +1,45 @@
+import os
+from typing import Protocol
+
+
+class SQSClient(Protocol):
+  """Subset of the boto3 SQS client API used by the consumer"""
+
+  def receive_message(self, **kwargs) -> dict: ...
+
+  def delete_message_batch(self, **kwargs) -> dict: ...
+
+  def change_message_visibility_batch(self, **kwargs) -> dict: ...
+
+  def send_message_batch(self, **kwargs) -> dict: ...
+
+  def get_queue_attributes(self, **kwargs) -> dict: ...
+
+
+_sqs_client: SQSClient | None = None
+
+
+def create_boto3_client() -> SQSClient:
+  # boto3 takes a noticeable share of startup to import; only pay for it when SQS is used
+  import boto3
+
+  return boto3.client(
+    "sqs",
+    region_name=os.getenv("AWS_REGION"),
+    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+  )
+
+
+def get_sqs_client() -> SQSClient:
+  """Return the SQS client, creating the boto3 client on first use"""
+  global _sqs_client
+  if _sqs_client is None:
+    _sqs_client = create_boto3_client()
+  return _sqs_client
+
+
+def set_sqs_client(client: SQSClient | None):
+  """Inject an SQS client, e.g. aws.local_sqs.LocalSQSClient. None restores the boto3 default."""
+  global _sqs_client
+  _sqs_client = client
@@ -0,0 +1,247 @@
+import asyncio
+import fcntl
+import logging
+import os
+import tempfile
+
+from config import load_environment
+
+load_environment()
+
+logger = logging.getLogger(__name__)
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# How workers agree on who consumes SQS: "postgres" advisory locks (works across hosts), "file" locks
+# (workers of one host) or "none" (every worker consumes)
+SQS_CONSUMER_LOCK = os.getenv("SQS_CONSUMER_LOCK", "postgres" if WEB_CONCURRENCY > 1 else "none")
+# Number of workers that consume at the same time; the others stand by to take over
+SQS_CONSUMER_WORKERS = int(os.getenv("SQS_CONSUMER_WORKERS", "1"))
+SQS_CONSUMER_LOCK_ID = int(os.getenv("SQS_CONSUMER_LOCK_ID", "51100"))
+SQS_CONSUMER_LOCK_DIR = os.getenv("SQS_CONSUMER_LOCK_DIR", tempfile.gettempdir())
+SQS_CONSUMER_LOCK_RETRY_SECONDS = float(os.getenv("SQS_CONSUMER_LOCK_RETRY_SECONDS", "5"))
+SQS_CONSUMER_LOCK_KEEPALIVE_SECONDS = float(os.getenv("SQS_CONSUMER_LOCK_KEEPALIVE_SECONDS", "10"))
+
+
+class NoLock:
+  """Every worker holds slot 0: for a single worker, or when each worker should consume"""
+
+  name = "none"
+
+  async def acquire(self, slots: int) -> int | None:
+    return 0
+
+  async def wait_lost(self):
+    await asyncio.Event().wait()
+
+  async def release(self):
+    pass
+
+  async def close(self):
+    pass
+
+
+class FileLock:
+  """One lock file per consumer slot; the OS releases it when the holding process dies"""
+
+  name = "file"
+
+  def __init__(self, directory: str, lock_id: int):
+    self.directory = directory
+    self.lock_id = lock_id
+    self._file = None
+
+  async def acquire(self, slots: int) -> int | None:
+    for slot in range(slots):
+      path = os.path.join(self.directory, f"queue-mgr-sqs-consumer-{self.lock_id}-{slot}.lock")
+      file = open(path, "a")
+      try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except BlockingIOError:
+        file.close()
+        continue
+      self._file = file
+      return slot
+    return None
+
+  async def wait_lost(self):
+    # A held flock is only lost with the process
+    await asyncio.Event().wait()
+
+  async def release(self):
+    if self._file is not None:
+      fcntl.flock(self._file, fcntl.LOCK_UN)
+      self._file.close()
+      self._file = None
+
+  async def close(self):
+    await self.release()
+
+
+class PostgresLock:
+  """Session-level advisory lock (SQS_CONSUMER_LOCK_ID, slot) on a dedicated connection.
+
+  Postgres releases the lock when the session ends, so a standby can take the slot
+  over once the holder's process dies or its connection drops. The connection is
+  pinged every SQS_CONSUMER_LOCK_KEEPALIVE_SECONDS; a holder that cannot reach the
+  database any more gives its slot up, because another worker may already hold it.
+  Standby workers keep their connection open between attempts.
+  """
+
+  name = "postgres"
+
+  def __init__(self, lock_id: int):
+    self.lock_id = lock_id
+    self._connection = None
+    self._slot = None
+
+  async def acquire(self, slots: int) -> int | None:
+    if self._connection is None or self._connection.is_closed():
+      # Imported here so that the "none" and "file" locks do not need a database URL
+      from db.database import connect_direct
+
+      self._connection = await connect_direct()
+    try:
+      for slot in range(slots):
+        if await self._connection.fetchval("SELECT pg_try_advisory_lock($1, $2)", self.lock_id, slot):
+          self._slot = slot
+          return slot
+    except Exception:
+      self._drop()
+      raise
+    return None
+
+  async def wait_lost(self):
+    lost = asyncio.Event()
+
+    def on_terminated(_):
+      lost.set()
+
+    self._connection.add_termination_listener(on_terminated)
+    try:
+      while not lost.is_set():
+        try:
+          await asyncio.wait_for(lost.wait(), SQS_CONSUMER_LOCK_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+          try:
+            await asyncio.wait_for(self._connection.execute("SELECT 1"), SQS_CONSUMER_LOCK_KEEPALIVE_SECONDS)
+          except Exception as e:
+            logger.error(f"⚠️ Consumer lock connection failed: {str(e) or type(e).__name__}")
+            return
+    finally:
+      self._connection.remove_termination_listener(on_terminated)
+
+  async def release(self):
+    slot, self._slot = self._slot, None
+    if slot is None or self._connection is None:
+      return
+    try:
+      await asyncio.wait_for(
+        self._connection.execute("SELECT pg_advisory_unlock($1, $2)", self.lock_id, slot),
+        SQS_CONSUMER_LOCK_KEEPALIVE_SECONDS
+      )
+    except Exception:
+      # Ending the session releases the lock as well
+      self._drop()
+
+  async def close(self):
+    await self.release()
+    if self._connection is not None:
+      await self._connection.close()
+      self._connection = None
+
+  def _drop(self):
+    if self._connection is not None:
+      self._connection.terminate()
+      self._connection = None
+
+
+class ConsumerElection:
+  """Runs the SQS consumer in at most `slots` workers at a time.
+
+  Each worker keeps trying to take one of the consumer slots. The holder of a slot
+  runs the consumer until it stops or the slot is lost; the others stand by and
+  retry every SQS_CONSUMER_LOCK_RETRY_SECONDS, so one of them takes over when a
+  consumer dies.
+  """
+
+  def __init__(self, lock, slots: int, retry_interval: float):
+    self.lock = lock
+    self.slots = slots
+    self.retry_interval = retry_interval
+    self.slot: int | None = None
+    self.elections = 0
+    self.lost = 0
+
+  @property
+  def role(self) -> str:
+    return "consumer" if self.slot is not None else "standby"
+
+  async def run(self, consume):
+    """Run `consume()` whenever this worker holds a consumer slot"""
+    try:
+      while True:
+        try:
+          slot = await self.lock.acquire(self.slots)
+        except Exception as e:
+          logger.error(f"⚠️ Consumer election failed: {str(e) or type(e).__name__}")
+          slot = None
+
+        if slot is None:
+          await asyncio.sleep(self.retry_interval)
+          continue
+
+        self.slot = slot
+        self.elections += 1
+        if self.lock.name != "none":
+          logger.info(f"👑 Worker {os.getpid()} holds SQS consumer slot {slot}")
+        try:
+          await self._consume_while_held(consume)
+        finally:
+          self.slot = None
+          await self.lock.release()
+        await asyncio.sleep(self.retry_interval)
+    finally:
+      try:
+        await self.lock.close()
+      except Exception as e:
+        logger.error(f"⚠️ Closing the consumer lock failed: {str(e) or type(e).__name__}")
+
+  async def _consume_while_held(self, consume):
+    consumer = asyncio.create_task(consume())
+    lost = asyncio.create_task(self.lock.wait_lost())
+    try:
+      await asyncio.wait([consumer, lost], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+      for task in (consumer, lost):
+        task.cancel()
+      await asyncio.gather(consumer, lost, return_exceptions=True)
+
+    if lost.done() and not lost.cancelled():
+      self.lost += 1
+      logger.warning(f"⚠️ Worker {os.getpid()} lost SQS consumer slot {self.slot}; stopping the consumer")
+    elif not consumer.cancelled() and consumer.exception() is not None:
+      logger.error(f"⚠️ SQS consumer stopped with exception: {str(consumer.exception())}")
+
+  def stats(self):
+    return {
+      "lock": self.lock.name,
+      "pid": os.getpid(),
+      "slots": self.slots,
+      "role": self.role,
+      "slot": self.slot,
+      "elections": self.elections,
+      "lost": self.lost,
+    }
+
+
+def create_consumer_lock():
+  if SQS_CONSUMER_LOCK == "none":
+    return NoLock()
+  if SQS_CONSUMER_LOCK == "file":
+    return FileLock(SQS_CONSUMER_LOCK_DIR, SQS_CONSUMER_LOCK_ID)
+  if SQS_CONSUMER_LOCK == "postgres":
+    return PostgresLock(SQS_CONSUMER_LOCK_ID)
+  raise ValueError(f"Unknown SQS_CONSUMER_LOCK {SQS_CONSUMER_LOCK!r}, expected postgres, file or none")
+
+
+consumer_election = ConsumerElection(create_consumer_lock(), SQS_CONSUMER_WORKERS, SQS_CONSUMER_LOCK_RETRY_SECONDS)
@@ -0,0 +1,46 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Callable
+
+from pydantic import BaseModel
+
+
+class UnknownEventError(ValueError):
+  """Raised for a message whose event type has no registered handler"""
+
+
+@dataclass(frozen=True)
+class EventHandler:
+  schema: type[BaseModel]
+  handle: Callable[[BaseModel], asyncio.Future]
+  partition_key: Callable[[BaseModel], str]
+
+
+EVENT_HANDLERS: dict[str, EventHandler] = {}
+
+
+def store_partition_key(event: BaseModel) -> str:
+  return f"store:{event.id}"
+
+
+def event_handler(event_type: str, schema: type[BaseModel], partition_key=store_partition_key):
+  """Register `handle(event)` for an SQS MessageGroupId.
+
+  The message body is validated against `schema` in a single pass and the handler
+  returns a future that resolves to True once the event is committed. Events with
+  the same partition key are processed in order.
+  """
+
+  def register(handle):
+    EVENT_HANDLERS[event_type] = EventHandler(schema, handle, partition_key)
+    return handle
+
+  return register
+
+
+def parse_event(body: str, event_type: str) -> tuple[EventHandler, BaseModel]:
+  """Look up the handler and validate the body. Raises UnknownEventError or ValidationError."""
+  handler = EVENT_HANDLERS.get(event_type)
+  if handler is None:
+    raise UnknownEventError(f"Unknown event type: {event_type}")
+  return handler, handler.schema.model_validate_json(body)
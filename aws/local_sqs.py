@@ -0,0 +1,218 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+DEFAULT_VISIBILITY_TIMEOUT = 30
+DEDUPLICATION_WINDOW_SECONDS = 300
+
+
+class _Message:
+  def __init__(self, body: str, group_id: str | None, attributes: dict | None):
+    self.id = str(uuid.uuid4())
+    self.body = body
+    self.group_id = group_id
+    self.message_attributes = attributes or {}
+    self.sent_at = time.time()
+    self.first_received_at = None
+    self.receive_count = 0
+    self.visible_at = 0.0
+    self.receipt_handle = None
+
+
+class _Queue:
+  def __init__(self, url: str):
+    self.url = url
+    self.fifo = url.endswith(".fifo")
+    self.messages: OrderedDict[str, _Message] = OrderedDict()
+    self.deduplication: dict[str, float] = {}
+    self.completed: list[tuple[float, float]] = []
+
+
+class LocalSQSClient:
+  """In-memory stand-in for the boto3 SQS client.
+
+  Models what the consumer relies on: FIFO message groups (a group is blocked
+  while one of its messages is in flight), visibility timeouts, receive counts,
+  long polling and the batch APIs. Queues are created on first use of a URL;
+  URLs ending in `.fifo` behave as FIFO queues. Calls are thread-safe so they
+  can run through `asyncio.to_thread` like the real client.
+  """
+
+  def __init__(self, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT):
+    self.visibility_timeout = visibility_timeout
+    self._queues: dict[str, _Queue] = {}
+    self._condition = threading.Condition()
+    self.calls: dict[str, int] = {}
+
+  def _queue(self, url: str) -> _Queue:
+    if url not in self._queues:
+      self._queues[url] = _Queue(url)
+    return self._queues[url]
+
+  def _count(self, operation: str):
+    self.calls[operation] = self.calls.get(operation, 0) + 1
+
+  def send_message(self, QueueUrl, MessageBody, MessageGroupId=None, MessageDeduplicationId=None,
+                   MessageAttributes=None, **kwargs):
+    with self._condition:
+      self._count("send_message")
+      message_id = self._send(self._queue(QueueUrl), MessageBody, MessageGroupId, MessageDeduplicationId,
+                              MessageAttributes)
+      self._condition.notify_all()
+      return {"MessageId": message_id}
+
+  def send_message_batch(self, QueueUrl, Entries, **kwargs):
+    with self._condition:
+      self._count("send_message_batch")
+      queue = self._queue(QueueUrl)
+      successful = []
+      for entry in Entries:
+        message_id = self._send(queue, entry["MessageBody"], entry.get("MessageGroupId"),
+                                entry.get("MessageDeduplicationId"), entry.get("MessageAttributes"))
+        successful.append({"Id": entry["Id"], "MessageId": message_id})
+      self._condition.notify_all()
+      return {"Successful": successful, "Failed": []}
+
+  @staticmethod
+  def _send(queue: _Queue, body, group_id, deduplication_id, attributes):
+    if queue.fifo:
+      now = time.time()
+      deduplication_id = deduplication_id or hashlib.sha256(body.encode()).hexdigest()
+      sent_at = queue.deduplication.get(deduplication_id)
+      if sent_at is not None and now - sent_at < DEDUPLICATION_WINDOW_SECONDS:
+        return None
+      queue.deduplication[deduplication_id] = now
+
+    message = _Message(body, group_id, attributes)
+    queue.messages[message.id] = message
+    return message.id
+
+  def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None, **kwargs):
+    deadline = time.time() + WaitTimeSeconds
+    with self._condition:
+      self._count("receive_message")
+      queue = self._queue(QueueUrl)
+      while True:
+        messages = self._take(queue, MaxNumberOfMessages, VisibilityTimeout)
+        remaining = deadline - time.time()
+        if messages or remaining <= 0:
+          return {"Messages": messages} if messages else {}
+        # Wake up on new messages, or when the next in-flight message becomes visible
+        self._condition.wait(min(remaining, self._next_visible_in(queue)))
+
+  def _take(self, queue: _Queue, limit: int, visibility_timeout):
+    now = time.time()
+    timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+    blocked_groups = set()
+    taken = []
+    for message in queue.messages.values():
+      if len(taken) >= limit:
+        break
+      if message.visible_at > now:
+        blocked_groups.add(message.group_id)
+        continue
+      if queue.fifo and message.group_id in blocked_groups:
+        continue
+
+      message.receive_count += 1
+      message.first_received_at = message.first_received_at or now
+      message.visible_at = now + timeout
+      message.receipt_handle = f"{message.id}:{message.receive_count}"
+      taken.append({
+        "MessageId": message.id,
+        "ReceiptHandle": message.receipt_handle,
+        "Body": message.body,
+        "MessageAttributes": message.message_attributes,
+        "Attributes": {
+          "MessageGroupId": message.group_id,
+          "ApproximateReceiveCount": str(message.receive_count),
+          "SentTimestamp": str(int(message.sent_at * 1000)),
+          "ApproximateFirstReceiveTimestamp": str(int(message.first_received_at * 1000)),
+        },
+      })
+    return taken
+
+  @staticmethod
+  def _next_visible_in(queue: _Queue):
+    now = time.time()
+    waits = [message.visible_at - now for message in queue.messages.values() if message.visible_at > now]
+    return max(min(waits), 0.001) if waits else 1.0
+
+  def _find(self, queue: _Queue, receipt_handle: str) -> _Message | None:
+    message = queue.messages.get(receipt_handle.split(":", 1)[0])
+    if message is None or message.receipt_handle != receipt_handle:
+      return None
+    return message
+
+  def delete_message(self, QueueUrl, ReceiptHandle, **kwargs):
+    with self._condition:
+      self._count("delete_message")
+      self._delete(self._queue(QueueUrl), ReceiptHandle)
+      self._condition.notify_all()
+      return {}
+
+  def delete_message_batch(self, QueueUrl, Entries, **kwargs):
+    with self._condition:
+      self._count("delete_message_batch")
+      queue = self._queue(QueueUrl)
+      for entry in Entries:
+        self._delete(queue, entry["ReceiptHandle"])
+      self._condition.notify_all()
+      return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+  def _delete(self, queue: _Queue, receipt_handle: str):
+    message = self._find(queue, receipt_handle)
+    if message is not None:
+      del queue.messages[message.id]
+      queue.completed.append((message.sent_at, time.time()))
+
+  def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout, **kwargs):
+    with self._condition:
+      self._count("change_message_visibility")
+      self._change_visibility(self._queue(QueueUrl), ReceiptHandle, VisibilityTimeout)
+      self._condition.notify_all()
+      return {}
+
+  def change_message_visibility_batch(self, QueueUrl, Entries, **kwargs):
+    with self._condition:
+      self._count("change_message_visibility_batch")
+      queue = self._queue(QueueUrl)
+      successful = []
+      failed = []
+      for entry in Entries:
+        if self._change_visibility(queue, entry["ReceiptHandle"], entry["VisibilityTimeout"]):
+          successful.append({"Id": entry["Id"]})
+        else:
+          failed.append({"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True})
+      self._condition.notify_all()
+      return {"Successful": successful, "Failed": failed}
+
+  def _change_visibility(self, queue: _Queue, receipt_handle: str, visibility_timeout: int) -> bool:
+    message = self._find(queue, receipt_handle)
+    if message is None:
+      return False
+    message.visible_at = time.time() + visibility_timeout
+    return True
+
+  def get_queue_attributes(self, QueueUrl, AttributeNames=None, **kwargs):
+    with self._condition:
+      self._count("get_queue_attributes")
+      queue = self._queue(QueueUrl)
+      now = time.time()
+      in_flight = sum(1 for message in queue.messages.values() if message.visible_at > now)
+      return {"Attributes": {
+        "ApproximateNumberOfMessages": str(len(queue.messages) - in_flight),
+        "ApproximateNumberOfMessagesNotVisible": str(in_flight),
+      }}
+
+  def completed(self, queue_url: str) -> list[tuple[float, float]]:
+    """(sent, deleted) timestamps of every message deleted from the queue"""
+    with self._condition:
+      return list(self._queue(queue_url).completed)
+
+  def depth(self, queue_url: str) -> int:
+    """Messages not yet deleted, visible or in flight"""
+    with self._condition:
+      return len(self._queue(queue_url).messages)
@@ -0,0 +1,69 @@
+import math
+import time
+from collections import deque
+
+DRAINING = "draining"
+IDLE = "idle"
+RATE_WINDOW_SECONDS = 60
+
+
+class PollScheduler:
+  """Decide how long each SQS receive waits and how many receivers run.
+
+  While messages keep arriving the consumer drains: a full batch is followed
+  immediately by a non-waiting receive, a partial batch by a 1s poll. Empty
+  receives double the long-poll wait up to `max_wait` seconds. When queue depth
+  is sampled (`ApproximateNumberOfMessages`), receivers scale with the backlog.
+  """
+
+  def __init__(self, max_wait: int, batch_size: int, max_receivers: int = 1):
+    self.max_wait = max_wait
+    self.batch_size = batch_size
+    self.max_receivers = max_receivers
+    self.mode = IDLE
+    self.wait_time = max_wait
+    self.receivers = 1
+    self.backlog = None
+    self._received = 0
+    self._window = deque()
+
+  def next_wait(self) -> int:
+    return self.wait_time
+
+  def record(self, received: int):
+    """Update the mode from the size of the last receive"""
+    now = time.monotonic()
+    if received:
+      self.mode = DRAINING
+      self.wait_time = 0 if received >= self.batch_size else min(1, self.max_wait)
+      self._received += received
+      self._window.append((now, received))
+    else:
+      self.mode = IDLE
+      self.wait_time = min(max(self.wait_time * 2, 1), self.max_wait)
+
+    while self._window and now - self._window[0][0] > RATE_WINDOW_SECONDS:
+      self._window.popleft()
+
+  def record_backlog(self, backlog: int):
+    """Scale receivers to the visible backlog, one receiver per few batches"""
+    self.backlog = backlog
+    wanted = math.ceil(backlog / (self.batch_size * 5)) if backlog else 1
+    self.receivers = max(1, min(wanted, self.max_receivers))
+
+  def rate(self) -> float:
+    """Messages received per second over the last minute"""
+    now = time.monotonic()
+    recent = sum(count for at, count in self._window if now - at <= RATE_WINDOW_SECONDS)
+    return recent / RATE_WINDOW_SECONDS
+
+  def stats(self):
+    return {
+      "mode": self.mode,
+      "waitTimeSeconds": self.wait_time,
+      "receivers": self.receivers,
+      "maxReceivers": self.max_receivers,
+      "backlog": self.backlog,
+      "received": self._received,
+      "messagesPerSecond": round(self.rate(), 2),
+    }
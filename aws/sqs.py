@@ -1,14 +1,19 @@
 import asyncio
-import json
 import logging
 import os
+import time
+from collections import Counter
 
-import boto3
+from pydantic import ValidationError
 
+from aws.client import get_sqs_client
+from aws.consumer_election import consumer_election
+from aws.events import UnknownEventError, parse_event
+from aws.scheduler import PollScheduler
+from aws.store_events import store_writer
+from aws.workers import KeyedWorkerPool
 from config import load_environment, setup_logging
-from db.database import get_db
-from repository.store import create_store, edit_store, edit_store_status
-from schemas import CreateStore, EditStore, EditStoreStatus
+from metrics import SQS_MESSAGES, observe_sqs_message_age
 
 load_environment()
 setup_logging()
@@ -18,121 +23,349 @@ logger = logging.getLogger(__name__)
 ENVIRONMENT = os.getenv("ENVIRONMENT", "prod")
 
 # AWS SQS Configuration
-AWS_REGION = os.getenv("AWS_REGION")
+SQS_CONSUMER_ENABLED = os.getenv("SQS_CONSUMER_ENABLED", "true").lower() == "true"
 AWS_SQS_QUEUE_URL = os.getenv("AWS_SQS_QUEUE_URL")
 AWS_SQS_DLQ_URL = os.getenv("AWS_SQS_DLQ_URL")
-MAX_RETRIES = 3
+AWS_SQS_WAIT_TIME_SECONDS = int(os.getenv("AWS_SQS_WAIT_TIME_SECONDS", "20"))  # longest idle poll
+AWS_SQS_MAX_MESSAGES = 10  # SQS hard limit for receive and batch calls
+AWS_SQS_ERROR_BACKOFF_SECONDS = 5
+MAX_RETRIES = int(os.getenv("SQS_MAX_RETRIES", "3"))
+SQS_RETRY_BASE_SECONDS = int(os.getenv("SQS_RETRY_BASE_SECONDS", "5"))
+SQS_RETRY_MAX_SECONDS = int(os.getenv("SQS_RETRY_MAX_SECONDS", "900"))
+AWS_SQS_MAX_VISIBILITY_TIMEOUT = 43200  # 12 hours
 
-# Create SQS client
-sqs_client = boto3.client(
-  "sqs",
-  region_name=AWS_REGION,
-  aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-  aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-)
+# Adaptive polling: receivers scale with the sampled backlog when SQS_MAX_RECEIVERS > 1
+SQS_MAX_RECEIVERS = int(os.getenv("SQS_MAX_RECEIVERS", "1"))
+SQS_BACKLOG_CHECK_SECONDS = int(os.getenv("SQS_BACKLOG_CHECK_SECONDS", "10"))
+
+# Event processing worker pool
+SQS_WORKER_CONCURRENCY = int(os.getenv("SQS_WORKER_CONCURRENCY", "8"))
+SQS_MAX_PENDING_MESSAGES = int(os.getenv("SQS_MAX_PENDING_MESSAGES", "100"))
+
+# The consumer reports unhealthy after this many receives in a row have failed
+SQS_UNHEALTHY_RECEIVE_ERRORS = int(os.getenv("SQS_UNHEALTHY_RECEIVE_ERRORS", "3"))
+
+poll_scheduler = PollScheduler(AWS_SQS_WAIT_TIME_SECONDS, AWS_SQS_MAX_MESSAGES, SQS_MAX_RECEIVERS)
+worker_pool = KeyedWorkerPool(SQS_WORKER_CONCURRENCY, SQS_MAX_PENDING_MESSAGES)
+
+# Failure counters per event type (MessageGroupId)
+retried_events = Counter()
+dead_lettered_events = Counter()
+
+# Receive health: failed receives since the last successful one
+receive_errors = 0
+last_receive_at = None
+
+
+def _batches(items, size=AWS_SQS_MAX_MESSAGES):
+  for i in range(0, len(items), size):
+    yield items[i:i + size]
+
+
+async def receive_messages(wait_time=AWS_SQS_WAIT_TIME_SECONDS):
+  """Poll SQS for up to 10 messages without blocking the event loop"""
+  response = await asyncio.to_thread(
+    get_sqs_client().receive_message,
+    QueueUrl=AWS_SQS_QUEUE_URL,
+    MaxNumberOfMessages=AWS_SQS_MAX_MESSAGES,
+    WaitTimeSeconds=wait_time,
+    AttributeNames=["All"],
+    MessageAttributeNames=["All"]
+  )
+  return response.get("Messages", [])
+
+
+async def delete_messages(receipt_handles):
+  """Acknowledge processed messages with batched deletes"""
+  for batch in _batches(receipt_handles):
+    response = await asyncio.to_thread(
+      get_sqs_client().delete_message_batch,
+      QueueUrl=AWS_SQS_QUEUE_URL,
+      Entries=[{"Id": str(i), "ReceiptHandle": handle} for i, handle in enumerate(batch)]
+    )
+    for failure in response.get("Failed", []):
+      logger.error(f"⚠️ Failed to delete message {failure['Id']}: {failure.get('Message')}")
+
+
+async def release_messages(releases):
+  """Make failed messages visible again after their (receipt handle, visibility timeout) delay"""
+  for batch in _batches(releases):
+    response = await asyncio.to_thread(
+      get_sqs_client().change_message_visibility_batch,
+      QueueUrl=AWS_SQS_QUEUE_URL,
+      Entries=[
+        {"Id": str(i), "ReceiptHandle": handle, "VisibilityTimeout": visibility_timeout}
+        for i, (handle, visibility_timeout) in enumerate(batch)
+      ]
+    )
+    for failure in response.get("Failed", []):
+      logger.error(f"⚠️ Failed to reset visibility of message {failure['Id']}: {failure.get('Message')}")
+
+
+async def dead_letter_messages(messages):
+  """Forward messages to the DLQ. Returns the messages that were sent."""
+  fifo = AWS_SQS_DLQ_URL.endswith(".fifo")
+  sent = []
+  for batch in _batches(messages):
+    entries = []
+    for i, message in enumerate(batch):
+      entry = {"Id": str(i), "MessageBody": message["Body"]}
+      if message.get("MessageAttributes"):
+        entry["MessageAttributes"] = message["MessageAttributes"]
+      if fifo:
+        entry["MessageGroupId"] = message.get("Attributes", {}).get("MessageGroupId") or "default"
+        entry["MessageDeduplicationId"] = message["MessageId"]
+      entries.append(entry)
+
+    response = await asyncio.to_thread(get_sqs_client().send_message_batch, QueueUrl=AWS_SQS_DLQ_URL, Entries=entries)
+    for success in response.get("Successful", []):
+      sent.append(batch[int(success["Id"])])
+    for failure in response.get("Failed", []):
+      logger.error(f"⚠️ Failed to forward message {failure['Id']} to DLQ: {failure.get('Message')}")
+  return sent
+
+
+def retry_delay(receive_count):
+  """Exponential visibility timeout for the next attempt of a message"""
+  delay = SQS_RETRY_BASE_SECONDS * 2 ** max(receive_count - 1, 0)
+  return min(delay, SQS_RETRY_MAX_SECONDS, AWS_SQS_MAX_VISIBILITY_TIMEOUT)
+
+
+async def settle_failed_messages(failed, rejected=()):
+  """Back off failed messages, or dead-letter them once their retry budget is used up.
+
+  `failed` holds (message, attempted) pairs; messages that were skipped to keep
+  per-store order are backed off but never dead-lettered on their own account.
+  `rejected` messages can never succeed (unknown event type or invalid body) and
+  are dead-lettered straight away.
+  """
+  releases = []
+  exhausted = list(rejected)
+  for message, attempted in failed:
+    attributes = message.get("Attributes", {})
+    receive_count = int(attributes.get("ApproximateReceiveCount", "1"))
+    if attempted and receive_count >= MAX_RETRIES:
+      exhausted.append(message)
+    else:
+      releases.append((message["ReceiptHandle"], retry_delay(receive_count)))
+      retried_events[attributes.get("MessageGroupId")] += 1
+
+  if exhausted and not AWS_SQS_DLQ_URL:
+    logger.error(f"⚠️ {len(exhausted)} message(s) rejected or out of retries but AWS_SQS_DLQ_URL is not set")
+  elif exhausted:
+    sent = await dead_letter_messages(exhausted)
+    await delete_messages([message["ReceiptHandle"] for message in sent])
+    for message in sent:
+      message_group_id = message.get("Attributes", {}).get("MessageGroupId")
+      dead_lettered_events[message_group_id] += 1
+      SQS_MESSAGES.labels("dead_lettered").inc()
+      logger.warning(f"☠️ Message {message['MessageId']} ({message_group_id}) moved to DLQ")
+    sent_ids = {message["MessageId"] for message in sent}
+    exhausted = [message for message in exhausted if message["MessageId"] not in sent_ids]
+
+  # Messages that could not be dead-lettered keep backing off at the maximum delay
+  for message in exhausted:
+    releases.append((message["ReceiptHandle"], min(SQS_RETRY_MAX_SECONDS, AWS_SQS_MAX_VISIBILITY_TIMEOUT)))
+
+  if releases:
+    await release_messages(releases)
+    logger.info(f"🔄 {len(releases)} message(s) scheduled for retry")
 
 
 async def poll_sqs():
   """Continuously poll SQS for new messages"""
+  # Create the client off the event loop so the import and credential lookup do not stall requests;
+  # if this fails the receivers retry it with their usual error backoff
+  try:
+    await asyncio.to_thread(get_sqs_client)
+  except Exception as e:
+    logger.error(f"⚠️ Failed to create the SQS client: {str(e)}")
+
+  batch_tasks = set()
+  tasks = [asyncio.create_task(receive_loop(index, batch_tasks)) for index in range(SQS_MAX_RECEIVERS)]
+  if SQS_MAX_RECEIVERS > 1:
+    tasks.append(asyncio.create_task(sample_backlog()))
+
+  try:
+    await asyncio.gather(*tasks)
+  finally:
+    # Stop the in-flight batch handlers too before closing the pool and the writer they use
+    pending = tasks + list(batch_tasks)
+    for task in pending:
+      task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    await worker_pool.close()
+    await store_writer.close()
+
+
+async def receive_loop(index, batch_tasks):
+  """Receiver `index` polls while the scheduler wants at least index + 1 receivers"""
+  global receive_errors, last_receive_at
   while True:
-    logger.info(f"🔎 Polling SQS for new messages")
+    if index >= poll_scheduler.receivers:
+      await asyncio.sleep(SQS_BACKLOG_CHECK_SECONDS)
+      continue
 
-    response = sqs_client.receive_message(
-      QueueUrl=AWS_SQS_QUEUE_URL,
-      MaxNumberOfMessages=1,
-      WaitTimeSeconds=1,
-      AttributeNames=["All"]
-    )
+    # Back-pressure: stop receiving while the worker pool is saturated, or while
+    # SQS_MAX_PENDING_MESSAGES worth of received batches still wait for their writes
+    await worker_pool.wait_for_capacity()
+    while len(batch_tasks) * AWS_SQS_MAX_MESSAGES >= SQS_MAX_PENDING_MESSAGES:
+      await asyncio.wait(set(batch_tasks), return_when=asyncio.FIRST_COMPLETED)
 
-    messages = response.get("Messages", [])
-    for message in messages:
-      receipt_handle = message["ReceiptHandle"]
-      body = message["Body"]
-      message_group_id = message.get("Attributes", {}).get("MessageGroupId", None)
-
-      try:
-        result = await process_message(body, message_group_id)
-
-        if result is True:
-          sqs_client.delete_message(QueueUrl=AWS_SQS_QUEUE_URL, ReceiptHandle=receipt_handle)
-          logger.info("✅ Message processed and deleted")
-        else:
-          logger.warning(f"⚠️ Processing failed")
-          sqs_client.change_message_visibility(
-            QueueUrl=AWS_SQS_QUEUE_URL,
-            ReceiptHandle=receipt_handle,
-            VisibilityTimeout=0
-          )
-          logger.info("🔄 Message visibility timeout reset")
-
-      except Exception as e:
-        logger.error(f"⚠️ Processing failed with exception: {str(e)}")
-        sqs_client.change_message_visibility(
-          QueueUrl=AWS_SQS_QUEUE_URL,
-          ReceiptHandle=receipt_handle,
-          VisibilityTimeout=0
-        )
-        logger.info("🔄 Message visibility timeout reset")
-
-    await asyncio.sleep(1)
-
-
-async def process_message(body, message_group_id):
-  """Process message body and save to database"""
-  logger.info(f"⌛ Processing {message_group_id} event message: {body}")
-
-  if message_group_id == 'store-create-event':
-    try:
-      converted_obj = json.loads(body)
-      logger.info(f"{converted_obj}")
-      new_store = CreateStore(
-        id=converted_obj["id"],
-        s_id=converted_obj["s_id"],
-        name=converted_obj["name"],
-        alias=converted_obj["alias"],
-        company_id=converted_obj["company_id"]
-      )
+    wait_time = poll_scheduler.next_wait()
+    logger.debug(f"🔎 Polling SQS for new messages (wait {wait_time}s)")
 
-      async for db in get_db():
-        await create_store(db, new_store)
-        logger.info("✅ Store created successfully")
-        return True
+    try:
+      messages = await receive_messages(wait_time)
     except Exception as e:
-      logger.error(f"⚠️ Store creation failed with exception: {str(e)}")
-      return False
+      receive_errors += 1
+      logger.error(f"⚠️ Receiving messages failed with exception: {str(e)}")
+      await asyncio.sleep(AWS_SQS_ERROR_BACKOFF_SECONDS)
+      continue
+    receive_errors = 0
+    last_receive_at = time.time()
+
+    mode = poll_scheduler.mode
+    poll_scheduler.record(len(messages))
+    if poll_scheduler.mode != mode:
+      logger.info(f"🔎 SQS poller switched to {poll_scheduler.mode} mode")
+
+    if messages:
+      task = asyncio.create_task(handle_messages(messages))
+      batch_tasks.add(task)
+      task.add_done_callback(batch_tasks.discard)
 
-  if message_group_id == 'store-update-event':
+
+async def sample_backlog():
+  """Periodically read the queue depth to scale the number of receivers"""
+  while True:
     try:
-      converted_obj = json.loads(body)
-      modified_store = EditStore(
-        id=converted_obj["id"],
-        name=converted_obj["name"],
-        alias=converted_obj["alias"]
+      response = await asyncio.to_thread(
+        get_sqs_client().get_queue_attributes,
+        QueueUrl=AWS_SQS_QUEUE_URL,
+        AttributeNames=["ApproximateNumberOfMessages"]
       )
-
-      async for db in get_db():
-        await edit_store(db, modified_store)
-        logger.info("✅ Store updated successfully")
-        return True
+      poll_scheduler.record_backlog(int(response["Attributes"]["ApproximateNumberOfMessages"]))
     except Exception as e:
-      logger.error(f"⚠️ Store update failed with exception: {str(e)}")
-      return False
+      logger.error(f"⚠️ Reading queue depth failed with exception: {str(e)}")
+    await asyncio.sleep(SQS_BACKLOG_CHECK_SECONDS)
+
 
-  if message_group_id == 'store-deactivate-event':
+async def handle_messages(messages):
+  """Process a received batch on the worker pool and acknowledge it in bulk"""
+  by_key = {}
+  rejected = []
+  SQS_MESSAGES.labels("received").inc(len(messages))
+  for message in messages:
+    observe_sqs_message_age(message)
+    message_group_id = message.get("Attributes", {}).get("MessageGroupId", None)
+    logger.debug(f"⌛ Received {message_group_id} event message: {message['Body']}")
     try:
-      converted_obj = json.loads(body)
-      logger.info(f"{converted_obj}")
-      modified_store = EditStoreStatus(
-        id=converted_obj["id"],
-        deactivated=True,
-      )
+      handler, event = parse_event(message["Body"], message_group_id)
+    except (UnknownEventError, ValidationError) as e:
+      logger.error(f"⚠️ Rejected {message_group_id} event message: {str(e)}")
+      rejected.append(message)
+      SQS_MESSAGES.labels("rejected").inc()
+      continue
+    by_key.setdefault(handler.partition_key(event), []).append((message, handler, event))
+
+  # One job per partition key, so a store's events in this batch are coalesced into a single write
+  jobs = [(items, worker_pool.submit(key, submit_events, items)) for key, items in by_key.items()]
+
+  submitted = []
+  for items, job in jobs:
+    try:
+      writes = await job
+    except Exception as e:
+      logger.error(f"⚠️ Processing failed with exception: {str(e)}")
+      writes = []
+    submitted.append((items, writes))
+  # Every event of the batch is queued now; commit them together instead of waiting for the flush timer
+  store_writer.flush()
+
+  processed = []
+  failed = []
+  for items, writes in submitted:
+    results = await wait_for_writes(items, writes)
+    for (message, _, _), result in zip(items, results):
+      if result is True:
+        processed.append(message["ReceiptHandle"])
+      else:
+        failed.append((message, result is not None))
+
+  SQS_MESSAGES.labels("processed").inc(len(processed))
+  SQS_MESSAGES.labels("failed").inc(len(failed))
+  try:
+    if processed:
+      await delete_messages(processed)
+      logger.info(f"✅ {len(processed)} message(s) processed and deleted")
+    if failed or rejected:
+      await settle_failed_messages(failed, rejected)
+  except Exception as e:
+    logger.error(f"⚠️ Acknowledging messages failed with exception: {str(e)}")
 
-      async for db in get_db():
-        await edit_store_status(db, modified_store)
-        logger.info("✅ Store deactivated successfully")
-        return True
+
+async def submit_events(items):
+  """Worker job for the parsed events of one partition key, in order.
+
+  Hands each event to its handler and returns the pending writes without waiting
+  for them to commit, so the worker slot is free for the next key while the store
+  writer keeps the writes in order.
+  """
+  writes = []
+  for message, handler, event in items:
+    try:
+      writes.append(handler.handle(event))
     except Exception as e:
-      logger.error(f"⚠️ Store deactivation failed with exception: {str(e)}")
-      return False
+      # Keep per-key order: events after a failed one wait for its retry
+      logger.error(f"⚠️ Processing {message.get('Attributes', {}).get('MessageGroupId')} event failed "
+                   f"with exception: {str(e)}")
+      break
+  return writes
+
+
+async def wait_for_writes(items, writes):
+  """Results for the events of a job that submitted `writes`.
+
+  True when committed, False when it failed and None when it was skipped because
+  an earlier event of the key failed.
+  """
+  results = list(await asyncio.gather(*writes))
+  if len(writes) < len(items):
+    results.append(False)
+  results += [None] * (len(items) - len(results))
+
+  if not all(results):
+    _, handler, event = items[0]
+    groups = sorted({str(message.get("Attributes", {}).get("MessageGroupId")) for message, _, _ in items})
+    logger.warning(f"⚠️ {results.count(False)} {', '.join(groups)} event(s) for {handler.partition_key(event)} failed, "
+                   f"{results.count(None)} skipped until their retry")
+  return results
+
+
+def consumer_stats():
+  """Snapshot of the SQS consumer poller, worker pool and store writer"""
+  return {
+    **worker_pool.stats(),
+    "poller": poll_scheduler.stats(),
+    "writer": store_writer.stats(),
+    "retries": dict(retried_events),
+    "deadLettered": dict(dead_lettered_events),
+    "election": consumer_election.stats(),
+  }
+
+
+def consumer_health(task: asyncio.Task | None):
+  """Health of the consumer task started by the app: running and, on the consuming worker, able to receive"""
+  if not SQS_CONSUMER_ENABLED:
+    return {"healthy": True, "enabled": False}
 
-  return False
+  running = task is not None and not task.done()
+  consuming = consumer_election.role == "consumer"
+  return {
+    "healthy": running and (not consuming or receive_errors < SQS_UNHEALTHY_RECEIVE_ERRORS),
+    "running": running,
+    "role": consumer_election.role,
+    "receiveErrors": receive_errors,
+    "lastReceiveAt": last_receive_at,
+  }
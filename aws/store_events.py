@@ -0,0 +1,26 @@
+import os
+
+from aws.events import event_handler
+from aws.store_writer import StoreEventWriter
+from schemas import CreateStore, EditStore, StoreDeactivateEvent
+
+# Store write batching
+STORE_WRITE_BATCH_SIZE = int(os.getenv("STORE_WRITE_BATCH_SIZE", "100"))
+STORE_WRITE_FLUSH_MS = int(os.getenv("STORE_WRITE_FLUSH_MS", "50"))
+
+store_writer = StoreEventWriter(STORE_WRITE_BATCH_SIZE, STORE_WRITE_FLUSH_MS / 1000)
+
+
+@event_handler("store-create-event", CreateStore)
+def on_store_create(event: CreateStore):
+  return store_writer.submit(event.id, event.model_dump(exclude={"id"}), create=True)
+
+
+@event_handler("store-update-event", EditStore)
+def on_store_update(event: EditStore):
+  return store_writer.submit(event.id, event.model_dump(exclude={"id"}))
+
+
+@event_handler("store-deactivate-event", StoreDeactivateEvent)
+def on_store_deactivate(event: StoreDeactivateEvent):
+  return store_writer.submit(event.id, {"deactivated": True})
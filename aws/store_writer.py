@@ -0,0 +1,174 @@
+import asyncio
+import logging
+
+from db.database import SessionLocal, engine
+from repository.changes import publish_store
+from repository.store import update_stores, upsert_stores
+
+logger = logging.getLogger(__name__)
+
+
+class StoreEventWriter:
+  """Collect store events for a short window and apply them in a single transaction.
+
+  Events for the same store are coalesced into its final state, so a create followed by
+  updates becomes one upsert. Each submitted event gets a future that resolves to True
+  only after the transaction containing it has committed. A batch is cut when it reaches
+  `batch_size` events, when `flush()` is called or after `flush_interval`, whichever
+  comes first.
+  """
+
+  def __init__(self, batch_size: int, flush_interval: float):
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self._pending: dict[str, dict] = {}
+    self._waiters: dict[str, list[asyncio.Future]] = {}
+    self._pending_events = 0
+    self._timer: asyncio.Task | None = None
+    self._flush_tasks: set[asyncio.Task] = set()
+    self._lock = asyncio.Lock()
+    self._flush_requested = False
+    self._flushes = 0
+    self._events = 0
+    self._rows = 0
+    self._failed_flushes = 0
+    self._failed_events = 0
+
+  def submit(self, store_id: str, fields: dict, create: bool = False) -> asyncio.Future:
+    """Queue a change to a store. `create` events carry the full row and may insert it."""
+    state = self._pending.setdefault(store_id, {"create": False, "fields": {}})
+    state["create"] = state["create"] or create
+    state["fields"].update(fields)
+
+    future = asyncio.get_running_loop().create_future()
+    self._waiters.setdefault(store_id, []).append(future)
+    self._pending_events += 1
+
+    if self._pending_events >= self.batch_size:
+      self._start_flush()
+    elif self._timer is None:
+      self._timer = asyncio.create_task(self._flush_later())
+    return future
+
+  def flush(self):
+    """Commit the queued events now instead of when the flush timer fires.
+
+    While a batch is being applied, events queued in the meantime are cut as soon as it
+    finishes, so concurrent callers still share one transaction.
+    """
+    if not self._pending:
+      return
+    if self._lock.locked():
+      self._flush_requested = True
+    else:
+      self._start_flush()
+
+  async def _flush_later(self):
+    await asyncio.sleep(self.flush_interval)
+    self._start_flush()
+
+  def _start_flush(self):
+    if self._timer is not None and self._timer is not asyncio.current_task():
+      self._timer.cancel()
+    self._timer = None
+
+    pending, waiters, events = self._pending, self._waiters, self._pending_events
+    self._pending, self._waiters, self._pending_events = {}, {}, 0
+
+    task = asyncio.create_task(self._flush(pending, waiters, events))
+    self._flush_tasks.add(task)
+    task.add_done_callback(self._flush_tasks.discard)
+
+  async def _flush(self, pending: dict, waiters: dict, events: int):
+    # Batches are applied one at a time, in the order they were cut
+    async with self._lock:
+      committed = {}
+      try:
+        try:
+          await self._apply(pending)
+          committed = pending
+        except Exception as e:
+          logger.error(f"⚠️ Store batch of {len(pending)} row(s) failed, retrying per store: {str(e)}")
+          self._failed_flushes += 1
+          # Isolate the failing store(s) so one bad event does not fail the whole batch
+          for store_id, state in pending.items():
+            try:
+              await self._apply({store_id: state})
+            except Exception as store_error:
+              logger.error(f"⚠️ Store {store_id} write failed with exception: {str(store_error)}")
+            else:
+              committed[store_id] = state
+        self._invalidate(committed)
+      finally:
+        # Every event learns its outcome, even if publishing the changes failed
+        for store_id, futures in waiters.items():
+          self._resolve(futures, store_id in committed)
+
+      applied = sum(len(waiters[store_id]) for store_id in committed)
+      self._flushes += 1
+      self._events += applied
+      self._rows += len(committed)
+      self._failed_events += events - applied
+      if committed:
+        logger.info(f"✅ Applied {applied} store event(s) as {len(committed)} row write(s)")
+      if applied < events:
+        logger.error(f"⚠️ {events - applied} store event(s) for {len(pending) - len(committed)} store(s) failed")
+
+    if self._flush_requested:
+      self._flush_requested = False
+      if self._pending:
+        self._start_flush()
+
+  @staticmethod
+  async def _apply(pending: dict):
+    inserts = []
+    updates = []
+    for store_id, state in pending.items():
+      row = {"id": store_id, **state["fields"]}
+      if state["create"]:
+        row.setdefault("deactivated", False)
+        inserts.append(row)
+      else:
+        updates.append(row)
+
+    async with SessionLocal(bind=engine) as db:
+      try:
+        if inserts:
+          await upsert_stores(db, inserts)
+        if updates:
+          await update_stores(db, updates)
+        await db.commit()
+      except Exception:
+        await db.rollback()
+        raise
+
+  @staticmethod
+  def _invalidate(pending: dict):
+    # Stores whose deactivated flag changed drop their cached queues and notify stream subscribers
+    for store_id, state in pending.items():
+      if "deactivated" in state["fields"]:
+        publish_store(store_id, deactivated=state["fields"]["deactivated"])
+
+  @staticmethod
+  def _resolve(futures: list[asyncio.Future], result: bool):
+    for future in futures:
+      if not future.done():
+        future.set_result(result)
+
+  async def close(self):
+    """Flush queued events and wait for in-progress batches"""
+    if self._pending:
+      self._start_flush()
+    await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+  def stats(self):
+    return {
+      "batchSize": self.batch_size,
+      "flushIntervalMs": int(self.flush_interval * 1000),
+      "pendingEvents": self._pending_events,
+      "flushes": self._flushes,
+      "failedFlushes": self._failed_flushes,
+      "events": self._events,
+      "failedEvents": self._failed_events,
+      "rows": self._rows,
+    }
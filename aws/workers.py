@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedWorkerPool:
+  """Run jobs concurrently across keys while keeping submission order within each key"""
+
+  def __init__(self, concurrency: int, max_pending: int):
+    self.concurrency = concurrency
+    self.max_pending = max_pending
+    self._semaphore = asyncio.Semaphore(concurrency)
+    self._lanes: dict[str, deque] = {}
+    self._lane_tasks: set[asyncio.Task] = set()
+    self._has_capacity = asyncio.Event()
+    self._has_capacity.set()
+    self._pending = 0
+    self._in_flight = 0
+    self._completed = 0
+
+  def submit(self, key: str, func, *args) -> asyncio.Future:
+    """Queue `func(*args)` behind earlier jobs with the same key and return its future"""
+    future = asyncio.get_running_loop().create_future()
+    self._pending += 1
+    if self._pending >= self.max_pending:
+      self._has_capacity.clear()
+
+    lane = self._lanes.get(key)
+    if lane is None:
+      lane = self._lanes[key] = deque()
+      task = asyncio.create_task(self._run_lane(key, lane))
+      self._lane_tasks.add(task)
+      task.add_done_callback(self._lane_tasks.discard)
+    lane.append((func, args, future))
+    return future
+
+  async def wait_for_capacity(self):
+    """Block until fewer than `max_pending` jobs are queued or running"""
+    await self._has_capacity.wait()
+
+  async def _run_lane(self, key: str, lane: deque):
+    try:
+      while lane:
+        func, args, future = lane[0]
+        async with self._semaphore:
+          self._in_flight += 1
+          try:
+            result = await func(*args)
+          except Exception as e:
+            if not future.done():
+              future.set_exception(e)
+          else:
+            if not future.done():
+              future.set_result(result)
+          finally:
+            self._in_flight -= 1
+        lane.popleft()
+        self._job_done()
+    finally:
+      # Cancelled lanes fail their remaining jobs so callers do not wait forever
+      while lane:
+        _, _, future = lane.popleft()
+        future.cancel()
+        self._job_done()
+      del self._lanes[key]
+
+  def _job_done(self):
+    self._pending -= 1
+    self._completed += 1
+    if self._pending < self.max_pending:
+      self._has_capacity.set()
+
+  async def close(self):
+    """Cancel all running and queued jobs"""
+    for task in list(self._lane_tasks):
+      task.cancel()
+    await asyncio.gather(*self._lane_tasks, return_exceptions=True)
+
+  def stats(self):
+    return {
+      "concurrency": self.concurrency,
+      "maxPending": self.max_pending,
+      "inFlight": self._in_flight,
+      "queueDepth": self._pending - self._in_flight,
+      "activeKeys": len(self._lanes),
+      "completed": self._completed,
+    }
@@ -0,0 +1,122 @@
+"""Serialization cost of queue responses per 1,000 queues.
+
+Compares FastAPI's `response_model` path (validate each row into QueueResponse,
+validate the response again, jsonable_encoder, stdlib `json`) with the current
+path (`schemas.queue_to_json` + `ORJSONResponse`), from database rows and from
+cached QueueResponse objects. Both must produce identical bytes. No database is
+needed:
+
+  python -m benchmarks.serialization --queues 1000 --rounds 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("ENVIRONMENT", "bench")
+os.environ.setdefault("LOGGING_LEVEL", "WARNING")
+
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from schemas import QueueResponse, queue_to_json  # noqa: E402
+
+RESPONSE_FIELD = create_model_field("Response", list[QueueResponse], mode="serialization")
+
+
+def sample_rows(count: int):
+  """Stand-ins for database rows: attribute access only, as with sqlalchemy Row"""
+  return [
+    SimpleNamespace(
+      id=f"{n:08d}-0000-0000-0000-000000000000",
+      q_id=n,
+      queue_type="Virtual" if n % 2 else "Physical",
+      description=None if n % 3 == 0 else f"Queue {n} – Café “Downtown”",
+      status="Open" if n % 2 else "Closed",
+      capacity=n % 50,
+      deactivated=n % 10 == 0,
+      store_id=f"store-{n // 2}",
+      display_id=f"Q{n}",
+    )
+    for n in range(count)
+  ]
+
+
+async def before_from_rows(rows):
+  queues = [QueueResponse.model_validate(row) for row in rows]
+  return await before_from_cache(queues)
+
+
+async def before_from_cache(queues):
+  content = await serialize_response(field=RESPONSE_FIELD, response_content=queues)
+  return JSONResponse(content).body
+
+
+async def after(queues):
+  return ORJSONResponse([queue_to_json(queue) for queue in queues]).body
+
+
+async def time_per_round(render, source, rounds: int) -> float:
+  for _ in range(min(rounds, 20)):
+    await render(source)
+  started = time.process_time()
+  for _ in range(rounds):
+    await render(source)
+  return (time.process_time() - started) / rounds * 1000
+
+
+async def run(args):
+  rows = sample_rows(args.queues)
+  cached = [QueueResponse.model_validate(row) for row in rows]
+
+  outputs = {
+    "before": await before_from_rows(rows),
+    "beforeCached": await before_from_cache(cached),
+    "after": await after(rows),
+    "afterCached": await after(cached),
+  }
+  identical = len(set(outputs.values())) == 1
+
+  per_1000 = 1000 / args.queues
+  timings = {
+    "fromRows": (
+      await time_per_round(before_from_rows, rows, args.rounds),
+      await time_per_round(after, rows, args.rounds),
+    ),
+    "fromCache": (
+      await time_per_round(before_from_cache, cached, args.rounds),
+      await time_per_round(after, cached, args.rounds),
+    ),
+  }
+  return {
+    "queues": args.queues,
+    "bytes": len(outputs["after"]),
+    "identicalBytes": identical,
+    "cpuMsPer1000Queues": {
+      name: {
+        "before": round(before * per_1000, 3),
+        "after": round(after_ms * per_1000, 3),
+        "speedup": round(before / after_ms, 1),
+      }
+      for name, (before, after_ms) in timings.items()
+    },
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--queues", type=int, default=1000)
+  parser.add_argument("--rounds", type=int, default=200)
+  args = parser.parse_args()
+
+  report = asyncio.run(run(args))
+  print(json.dumps(report, indent=2))
+  sys.exit(0 if report["identicalBytes"] else 1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,78 @@
+"""Fan-out cost of queue stream changes to many idle subscribers.
+
+Subscribes `--subscribers` connections, spread over `--stores` stores (half to a
+queue, half to its store), then publishes `--changes` status changes and reports
+the publish time per change and per delivered frame, the memory held per
+subscriber, and how many slow subscribers were dropped when nobody reads their
+buffers. No database is needed:
+
+  python -m benchmarks.stream_fanout --subscribers 10000 --stores 100 --changes 50
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("ENVIRONMENT", "bench")
+os.environ.setdefault("LOGGING_LEVEL", "WARNING")
+
+from repository.queue_broker import STREAM_BUFFER_SIZE, QueueBroker  # noqa: E402
+
+
+def queue_change(store: int, status: str):
+  return {
+    "id": f"queue-{store}", "qId": store, "queueType": "Virtual", "description": None, "status": status,
+    "capacity": 0, "deactivated": False, "storeId": f"store-{store}", "displayId": f"Q{store}"
+  }
+
+
+def run(args):
+  broker = QueueBroker(args.subscribers, args.buffer)
+
+  tracemalloc.start()
+  baseline = tracemalloc.get_traced_memory()[0]
+  for n in range(args.subscribers):
+    store = n % args.stores
+    if n % 2:
+      broker.subscribe("store", f"store-{store}")
+    else:
+      broker.subscribe("queue", f"queue-{store}")
+  broker.remember([{"id": f"queue-{store}", "storeId": f"store-{store}"} for store in range(args.stores)])
+  per_subscriber = (tracemalloc.get_traced_memory()[0] - baseline) / args.subscribers
+  tracemalloc.stop()
+
+  started = time.perf_counter()
+  for change in range(args.changes):
+    status = "Open" if change % 2 else "Closed"
+    for store in range(args.stores):
+      broker.publish(queue_change(store, status))
+  elapsed = time.perf_counter() - started
+
+  stats = broker.stats()
+  published = args.changes * args.stores
+  return {
+    "subscribers": args.subscribers,
+    "bufferSize": args.buffer,
+    "bytesPerIdleSubscriber": round(per_subscriber),
+    "changes": published,
+    "delivered": stats["delivered"],
+    "droppedSubscribers": stats["droppedSubscribers"],
+    "microsecondsPerChange": round(elapsed / published * 1_000_000, 1),
+    "microsecondsPerFrame": round(elapsed / max(stats["delivered"], 1) * 1_000_000, 3),
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--subscribers", type=int, default=10000)
+  parser.add_argument("--stores", type=int, default=100)
+  parser.add_argument("--changes", type=int, default=50, help="changes per queue")
+  parser.add_argument("--buffer", type=int, default=STREAM_BUFFER_SIZE, help="frames buffered per subscriber")
+  args = parser.parse_args()
+
+  print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+  main()
@@ -4,7 +4,17 @@ import os
 from dotenv import load_dotenv
 
 
+_environment_loaded = False
+_logging_configured = False
+
+
 def load_environment():
+  """Load the .env file for ENVIRONMENT once per process; later calls are no-ops"""
+  global _environment_loaded
+  if _environment_loaded:
+    return
+  _environment_loaded = True
+
   env = os.getenv("ENVIRONMENT", "prod")
   if env == "prod":
     load_dotenv(".env.production")
@@ -15,6 +25,12 @@ def load_environment():
 
 
 def setup_logging():
+  """Configure the root logger once per process; later calls are no-ops"""
+  global _logging_configured
+  if _logging_configured:
+    return
+  _logging_configured = True
+
   log_level_str = os.environ.get("LOGGING_LEVEL", "INFO").upper()
   numeric_level = getattr(logging, log_level_str, logging.INFO)
 
@@ -1,14 +1,28 @@
+import asyncio
 import logging
+import math
 import os
 import ssl
+import time
+from contextlib import asynccontextmanager
 
-from sqlalchemy import delete
+import asyncpg
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from fastapi import Request
+from sqlalchemy import delete, make_url, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from config import load_environment, setup_logging
-from db.base import Base
 from db.models import StaticTable, StoreTable, QueueTable
+from db.pool import ENGINE_PROFILES, InstrumentedPool, engine_settings
+from db.slow_queries import slow_query_log
+from metrics import instrument_engine
 
 load_environment()
 setup_logging()
@@ -17,6 +31,18 @@ logger = logging.getLogger(__name__)
 
 ENVIRONMENT = os.getenv("ENVIRONMENT", "prod")
 DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+# How long reads stay on the primary after the replica fails to connect
+DB_READ_RETRY_SECONDS = float(os.getenv("DB_READ_RETRY_SECONDS", "30"))
+# Read-your-writes: a client's reads go to the primary for this long after it writes (0 disables)
+DB_READ_PIN_SECONDS = float(os.getenv("DB_READ_PIN_SECONDS", "0"))
+READ_PIN_COOKIE = "queue-mgr-read-primary-until"
+DB_PROFILE = os.getenv("DB_PROFILE") or (ENVIRONMENT if ENVIRONMENT in ENGINE_PROFILES else "prod")
+# Upgrade the schema at startup; in prod migrations run once before the workers start
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false" if ENVIRONMENT == "prod" else "true").lower() == "true"
+# The health check reports the database unhealthy when SELECT 1 takes longer
+DB_HEALTH_TIMEOUT_SECONDS = float(os.getenv("DB_HEALTH_TIMEOUT_SECONDS", "2"))
+ALEMBIC_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
 
 logger.info(f"🚀 Running in {ENVIRONMENT.upper()} environment")
 
@@ -28,13 +54,31 @@ if not DATABASE_URL:
 ssl_context = ssl.create_default_context() if ENVIRONMENT == "prod" else None
 
 # Create async engine
-engine = create_async_engine(
-  DATABASE_URL,
-  echo=True,
-  pool_pre_ping=True,
-  connect_args={"ssl": ssl_context} if ssl_context else {}
+engine_config = engine_settings(DB_PROFILE)
+connect_args = {}
+statement_cache_size = engine_config.pop("prepared_statement_cache_size")
+if make_url(DATABASE_URL).get_driver_name() == "asyncpg":
+  connect_args["prepared_statement_cache_size"] = statement_cache_size
+if ssl_context:
+  connect_args["ssl"] = ssl_context
+
+engine = create_async_engine(DATABASE_URL, poolclass=InstrumentedPool, connect_args=connect_args, **engine_config)
+instrument_engine(engine, slow_query_log.observe)
+logger.info(
+  f"🔌 Database profile {DB_PROFILE}: pool_size={engine_config['pool_size']}, "
+  f"max_overflow={engine_config['max_overflow']}, echo={engine_config['echo']}"
 )
 
+# Optional read replica for read-only routes, with the same settings as the primary
+read_engine = None
+if DATABASE_READ_URL:
+  read_engine = create_async_engine(
+    DATABASE_READ_URL, poolclass=InstrumentedPool, connect_args=connect_args, **engine_config
+  )
+  read_engine.sync_engine.pool.name = "read"
+  instrument_engine(read_engine, slow_query_log.observe)
+  logger.info("🔌 Read-only routes use the read replica")
+
 SessionLocal = sessionmaker(
   autocommit=False,
   autoflush=False,
@@ -43,32 +87,47 @@ SessionLocal = sessionmaker(
 )
 
 
-# Function to create tables asynchronously
-async def create_tables():
-  async with engine.begin() as conn:
-    await conn.run_sync(Base.metadata.create_all)
+def _upgrade_schema(connection):
+  config = Config(ALEMBIC_CONFIG)
+  config.attributes["connection"] = connection
+  command.upgrade(config, "head")
+
 
+def _schema_revision(connection):
+  return MigrationContext.configure(connection).get_current_revision()
 
-# Run table creation when the application starts
+
+# Check the schema version when the application starts
 async def init_db():
-  await create_tables()
+  if DB_AUTO_MIGRATE:
+    async with engine.begin() as conn:
+      await conn.run_sync(_upgrade_schema)
+
+  async with engine.connect() as conn:
+    revision = await conn.run_sync(_schema_revision)
+
+  head = ScriptDirectory.from_config(Config(ALEMBIC_CONFIG)).get_current_head()
+  if revision != head:
+    raise RuntimeError(f"Database schema is at revision {revision}, expected {head}. Run `alembic upgrade head`.")
+  logger.info(f"✅ Database schema is at revision {head}")
 
 
-# Insert static values
+# Insert static values; rows that already exist are left untouched
 async def insert_static():
+  records = [
+    {"key": "Open", "value": "Open", "type": "Queue_Status"},
+    {"key": "Closed", "value": "Closed", "type": "Queue_Status"},
+    {"key": "Virtual", "value": "Virtual", "type": "Queue_Type"},
+    {"key": "Physical", "value": "Physical", "type": "Queue_Type"},
+  ]
   async with SessionLocal(bind=engine) as session:
-    try:
-      records = [
-        StaticTable(key='Open', value='Open', type='Queue_Status'),
-        StaticTable(key='Closed', value='Closed', type='Queue_Status'),
-        StaticTable(key='Virtual', value='Virtual', type='Queue_Type'),
-        StaticTable(key='Physical', value='Physical', type='Queue_Type'),
-      ]
-      session.add_all(records)
-      await session.commit()
-    except Exception as e:
-      await session.rollback()
-      logger.error(f"Error inserting records: {e}")
+    result = await session.execute(
+      insert(StaticTable).values(records).on_conflict_do_nothing(index_elements=[StaticTable.key])
+    )
+    await session.commit()
+
+  if result.rowcount:
+    logger.info(f"✅ Inserted {result.rowcount} static record(s)")
 
 
 # Insert test data
@@ -202,7 +261,130 @@ async def insert_test_data():
   logger.info("Test data insertion complete")
 
 
+class ReadRouting:
+  """Picks the engine for read-only sessions and keeps reads off a replica that fails to connect"""
+
+  def __init__(self, replica, retry_after: float):
+    self.replica = replica
+    self.retry_after = retry_after
+    self.down_until = 0.0
+    self.replica_reads = 0
+    self.primary_reads = 0
+    self.pinned_reads = 0
+    self.fallbacks = 0
+
+  def replica_available(self) -> bool:
+    return self.replica is not None and time.monotonic() >= self.down_until
+
+  def replica_failed(self, error: Exception):
+    self.down_until = time.monotonic() + self.retry_after
+    self.fallbacks += 1
+    logger.warning(f"⚠️ Read replica unavailable, reading from the primary for {self.retry_after}s: {str(error)}")
+
+  def stats(self):
+    return {
+      "replica": self.replica is not None,
+      "replicaAvailable": self.replica_available(),
+      "replicaReads": self.replica_reads,
+      "primaryReads": self.primary_reads,
+      "pinnedReads": self.pinned_reads,
+      "fallbacks": self.fallbacks,
+      "replicaPool": self.replica.sync_engine.pool.stats() if self.replica is not None else None,
+    }
+
+
+read_routing = ReadRouting(read_engine, DB_READ_RETRY_SECONDS)
+
+
+def pool_stats():
+  return engine.sync_engine.pool.stats()
+
+
+async def connect_direct() -> asyncpg.Connection:
+  """A dedicated asyncpg connection to the primary, outside the pool, for LISTEN and session-level locks"""
+  # asyncpg takes a plain postgresql:// DSN, without SQLAlchemy's driver suffix
+  url = make_url(DATABASE_URL).set(drivername="postgresql")
+  return await asyncpg.connect(url.render_as_string(hide_password=False), ssl=ssl_context)
+
+
+async def dispose_engines():
+  """Close every pooled connection, e.g. before worker processes start"""
+  await engine.dispose()
+  if read_engine is not None:
+    await read_engine.dispose()
+
+
+async def _ping():
+  async with engine.connect() as conn:
+    await conn.execute(text("SELECT 1"))
+
+
+async def database_health():
+  """Whether the primary answers a trivial query within DB_HEALTH_TIMEOUT_SECONDS"""
+  started = time.perf_counter()
+  try:
+    await asyncio.wait_for(_ping(), DB_HEALTH_TIMEOUT_SECONDS)
+  except Exception as e:
+    logger.warning(f"⚠️ Database health check failed: {str(e) or type(e).__name__}")
+    return {"healthy": False, "error": str(e) or type(e).__name__}
+  return {"healthy": True, "latencyMs": round((time.perf_counter() - started) * 1000, 1)}
+
+
+@asynccontextmanager
+async def read_session(pinned: bool = False):
+  """Session for read-only work: on the replica when configured and reachable, otherwise on the primary.
+
+  `pinned` sessions always use the primary and are marked with info["read_your_writes"].
+  """
+  if pinned:
+    read_routing.pinned_reads += 1
+  elif read_routing.replica_available():
+    async with SessionLocal(bind=read_engine) as session:
+      try:
+        await session.connection()
+      except (OSError, asyncio.TimeoutError, DBAPIError) as e:
+        read_routing.replica_failed(e)
+      else:
+        read_routing.replica_reads += 1
+        yield session
+        return
+
+  if not pinned:
+    read_routing.primary_reads += 1
+  async with SessionLocal(bind=engine) as session:
+    session.info["read_your_writes"] = pinned
+    yield session
+
+
+def pinned_to_primary(request: Request) -> bool:
+  """Whether the client wrote within the last DB_READ_PIN_SECONDS"""
+  try:
+    return float(request.cookies.get(READ_PIN_COOKIE, 0)) > time.time()
+  except ValueError:
+    return False
+
+
+async def pin_reads_after_writes(request: Request, call_next):
+  """Middleware sending a client's reads to the primary for a while after a successful write"""
+  response = await call_next(request)
+  if getattr(request.state, "wrote", False) and response.status_code < 400:
+    response.set_cookie(
+      READ_PIN_COOKIE,
+      str(time.time() + DB_READ_PIN_SECONDS),
+      max_age=math.ceil(DB_READ_PIN_SECONDS),
+      httponly=True
+    )
+  return response
+
+
 # Dependency for async DB session
-async def get_db():
+async def get_db(request: Request):
+  request.state.wrote = True
   async with SessionLocal(bind=engine) as session:
     yield session
+
+
+# Dependency for read-only routes
+async def get_read_db(request: Request):
+  async with read_session(pinned=pinned_to_primary(request)) as session:
+    yield session
@@ -0,0 +1,177 @@
+import logging
+import os
+import time
+import weakref
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from metrics import DB_CHECKOUT_SETUP_SECONDS, DB_CHECKOUT_WAIT_SECONDS
+from profiling import add_timing
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_SATURATION_LOG_SECONDS = float(os.getenv("DB_POOL_SATURATION_LOG_SECONDS", "10"))
+
+# Engine settings per DB_PROFILE. Every uvicorn worker has its own pool, so keep
+# workers x (pool_size + max_overflow) below the server's max_connections.
+ENGINE_PROFILES = {
+  "prod": {
+    "echo": False,
+    "pool_size": 10,
+    "max_overflow": 5,
+    "pool_timeout": 10,
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+    "prepared_statement_cache_size": 500,
+  },
+  "local": {
+    "echo": True,
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout": 30,
+    "pool_recycle": 3600,
+    "pool_pre_ping": True,
+    "prepared_statement_cache_size": 100,
+  },
+  # A fixed-size pool without pings so benchmark runs are comparable
+  "bench": {
+    "echo": False,
+    "pool_size": 20,
+    "max_overflow": 0,
+    "pool_timeout": 30,
+    "pool_recycle": -1,
+    "pool_pre_ping": False,
+    "prepared_statement_cache_size": 500,
+  },
+}
+
+# DB_ECHO, DB_POOL_SIZE, ... override single settings of the profile
+ENGINE_OVERRIDES = {
+  "echo": ("DB_ECHO", lambda value: value.lower() == "true"),
+  "pool_size": ("DB_POOL_SIZE", int),
+  "max_overflow": ("DB_MAX_OVERFLOW", int),
+  "pool_timeout": ("DB_POOL_TIMEOUT", float),
+  "pool_recycle": ("DB_POOL_RECYCLE", int),
+  "pool_pre_ping": ("DB_POOL_PRE_PING", lambda value: value.lower() == "true"),
+  "prepared_statement_cache_size": ("DB_PREPARED_STATEMENT_CACHE_SIZE", int),
+}
+
+
+def engine_settings(profile: str) -> dict:
+  """Settings of `profile` with any environment overrides applied"""
+  if profile not in ENGINE_PROFILES:
+    raise ValueError(f"Unknown DB_PROFILE {profile!r}, expected one of {', '.join(ENGINE_PROFILES)}")
+
+  settings = dict(ENGINE_PROFILES[profile])
+  for name, (variable, parse) in ENGINE_OVERRIDES.items():
+    value = os.getenv(variable)
+    if value:
+      settings[name] = parse(value)
+  return settings
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+  """Queue pool that records checkout wait and connect latency, and logs when it runs out of connections.
+
+  A checkout is split into the wait for a free slot (`_do_get`, minus any new
+  connection it opened) and the setup after it: opening a connection and the
+  pre-ping round trip.
+  """
+
+  # Label of the pool in metrics, "read" for the replica's pool
+  name = "primary"
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.checkouts = 0
+    self.waited_checkouts = 0
+    self.wait_seconds = 0.0
+    self.max_wait_seconds = 0.0
+    self.setup_seconds = 0.0
+    self.max_setup_seconds = 0.0
+    self.timeouts = 0
+    self.connects = 0
+    self.connect_seconds = 0.0
+    self.max_connect_seconds = 0.0
+    self.saturations = 0
+    self._saturation_logged_at = 0.0
+    # Per connection record: duration of the last _do_get, and of a connect made inside it
+    self._get_seconds = weakref.WeakKeyDictionary()
+    self._create_seconds = weakref.WeakKeyDictionary()
+
+  def connect(self):
+    started = time.perf_counter()
+    try:
+      connection = super().connect()
+    except exc.TimeoutError:
+      self.timeouts += 1
+      logger.error(f"❌ DB pool checkout timed out after {self._timeout}s ({self.status()})")
+      raise
+
+    elapsed = time.perf_counter() - started
+    record = connection._connection_record
+    waited = max(self._get_seconds.pop(record, 0.0) - self._create_seconds.pop(record, 0.0), 0.0)
+    setup = max(elapsed - waited, 0.0)
+    DB_CHECKOUT_WAIT_SECONDS.labels(self.name).observe(waited)
+    DB_CHECKOUT_SETUP_SECONDS.labels(self.name).observe(setup)
+    add_timing("poolWait", waited)
+    add_timing("poolSetup", setup)
+    self.checkouts += 1
+    self.wait_seconds += waited
+    self.max_wait_seconds = max(self.max_wait_seconds, waited)
+    self.setup_seconds += setup
+    self.max_setup_seconds = max(self.max_setup_seconds, setup)
+    # Anything slower than a queue handoff counts as waiting for a free slot
+    if waited > 0.001:
+      self.waited_checkouts += 1
+
+    if self.checkedout() >= self.size() + max(self._max_overflow, 0):
+      self.saturations += 1
+      now = time.monotonic()
+      if now - self._saturation_logged_at >= DB_POOL_SATURATION_LOG_SECONDS:
+        self._saturation_logged_at = now
+        logger.warning(f"⚠️ DB pool saturated: {self.checkedout()} connection(s) checked out ({self.status()})")
+    return connection
+
+  def recreate(self):
+    pool = super().recreate()
+    pool.name = self.name
+    return pool
+
+  def _do_get(self):
+    # QueuePool._do_get may call itself; the outermost call finishes last and overwrites the inner ones
+    started = time.perf_counter()
+    record = super()._do_get()
+    self._get_seconds[record] = time.perf_counter() - started
+    return record
+
+  def _create_connection(self):
+    started = time.perf_counter()
+    record = super()._create_connection()
+    elapsed = time.perf_counter() - started
+    self._create_seconds[record] = elapsed
+    self.connects += 1
+    self.connect_seconds += elapsed
+    self.max_connect_seconds = max(self.max_connect_seconds, elapsed)
+    return record
+
+  def stats(self):
+    return {
+      "size": self.size(),
+      "maxOverflow": self._max_overflow,
+      "checkedOut": self.checkedout(),
+      "checkedIn": self.checkedin(),
+      "overflow": max(self.overflow(), 0),
+      "checkouts": self.checkouts,
+      "waitedCheckouts": self.waited_checkouts,
+      "avgWaitMs": round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else None,
+      "maxWaitMs": round(self.max_wait_seconds * 1000, 3),
+      "avgSetupMs": round(self.setup_seconds / self.checkouts * 1000, 3) if self.checkouts else None,
+      "maxSetupMs": round(self.max_setup_seconds * 1000, 3),
+      "timeouts": self.timeouts,
+      "saturations": self.saturations,
+      "connects": self.connects,
+      "avgConnectMs": round(self.connect_seconds / self.connects * 1000, 3) if self.connects else None,
+      "maxConnectMs": round(self.max_connect_seconds * 1000, 3),
+    }
@@ -0,0 +1,68 @@
+import hashlib
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than DB_SLOW_QUERY_MS are logged as warnings, slower than DB_VERY_SLOW_QUERY_MS as errors (0 disables)
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "250"))
+DB_VERY_SLOW_QUERY_MS = float(os.getenv("DB_VERY_SLOW_QUERY_MS", "1000"))
+SLOW_QUERY_STATS_MAX_ENTRIES = 100
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\$\d+|%\(\w+\)s|\?|\b\d+(?:\.\d+)?\b")
+_VALUE_LISTS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> tuple[str, str]:
+  """Statement with literals and parameters replaced by ?, and a short hash of it for grouping"""
+  normalized = _WHITESPACE.sub(" ", _LITERALS.sub("?", statement)).strip()
+  normalized = _VALUE_LISTS.sub("(?, ...)", normalized)
+  return normalized, hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+class SlowQueryLog:
+  """Logs the slow statements timed by metrics.instrument_engine, with their fingerprint and repository function"""
+
+  def __init__(self, slow_ms: float, very_slow_ms: float):
+    self.slow_ms = slow_ms
+    self.very_slow_ms = very_slow_ms
+    self.slow_queries = 0
+    self._by_fingerprint = {}
+
+  def observe(self, statement: str, source: str, seconds: float):
+    elapsed_ms = seconds * 1000
+    if not self.slow_ms or elapsed_ms < self.slow_ms:
+      return
+
+    normalized, digest = fingerprint(statement)
+    self.slow_queries += 1
+    self._record(digest, normalized, source, elapsed_ms)
+
+    level = logging.ERROR if self.very_slow_ms and elapsed_ms >= self.very_slow_ms else logging.WARNING
+    logger.log(level, f"🐢 Slow query {digest} in {source} took {elapsed_ms:.1f}ms: {normalized}")
+
+  def _record(self, digest: str, normalized: str, source: str, elapsed_ms: float):
+    entry = self._by_fingerprint.get(digest)
+    if entry is None:
+      if len(self._by_fingerprint) >= SLOW_QUERY_STATS_MAX_ENTRIES:
+        return
+      entry = self._by_fingerprint[digest] = {"statement": normalized, "functions": [], "count": 0, "maxMs": 0.0}
+    entry["count"] += 1
+    entry["maxMs"] = round(max(entry["maxMs"], elapsed_ms), 1)
+    if source not in entry["functions"]:
+      entry["functions"].append(source)
+
+  def stats(self):
+    return {
+      "slowMs": self.slow_ms,
+      "verySlowMs": self.very_slow_ms,
+      "slowQueries": self.slow_queries,
+      "byFingerprint": dict(
+        sorted(self._by_fingerprint.items(), key=lambda item: item[1]["count"], reverse=True)[:20]
+      ),
+    }
+
+
+slow_query_log = SlowQueryLog(DB_SLOW_QUERY_MS, DB_VERY_SLOW_QUERY_MS)
@@ -0,0 +1,135 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+
+from profiling import add_timing
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+# Fast buckets for work that normally finishes in milliseconds
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_SECONDS = Histogram(
+  "queue_mgr_http_request_duration_seconds", "HTTP request latency by route template and status code",
+  ["method", "route", "status"], buckets=FAST_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram(
+  "queue_mgr_db_query_duration_seconds", "Database statement duration by the repository function that ran it",
+  ["function"], buckets=FAST_BUCKETS
+)
+DB_QUERY_ERRORS = Counter(
+  "queue_mgr_db_query_errors_total", "Database statements that raised, by repository function", ["function"]
+)
+DB_CHECKOUT_WAIT_SECONDS = Histogram(
+  "queue_mgr_db_checkout_wait_seconds", "Time spent waiting for a free slot in the database pool",
+  ["pool"], buckets=FAST_BUCKETS
+)
+DB_CHECKOUT_SETUP_SECONDS = Histogram(
+  "queue_mgr_db_checkout_setup_seconds", "Time a checkout spent connecting and pre-pinging after it got a slot",
+  ["pool"], buckets=FAST_BUCKETS
+)
+SQS_MESSAGES = Counter(
+  "queue_mgr_sqs_messages_total", "SQS messages by outcome (received, processed, failed, rejected, dead_lettered)",
+  ["outcome"]
+)
+SQS_MESSAGE_AGE_SECONDS = Histogram(
+  "queue_mgr_sqs_message_age_seconds", "Age of received SQS messages from their SentTimestamp",
+  buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, 12 * 3600)
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+  "queue_mgr_event_loop_lag_seconds", "How late the event loop woke a sleeping task", buckets=FAST_BUCKETS
+)
+EVENT_LOOP_LAG_LAST_SECONDS = Gauge("queue_mgr_event_loop_lag_last_seconds", "Most recent event loop lag sample")
+HEALTHY = Gauge("queue_mgr_healthy", "1 when the last health check passed, by component", ["component"])
+
+# Repository function that is running the current statement
+query_source = contextvars.ContextVar("query_source", default="other")
+
+
+def track_queries(func):
+  """Attribute the statements an async repository function executes to it in DB_QUERY_SECONDS"""
+  name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+  @functools.wraps(func)
+  async def wrapper(*args, **kwargs):
+    token = query_source.set(name)
+    try:
+      return await func(*args, **kwargs)
+    finally:
+      query_source.reset(token)
+
+  return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _handle_error(context):
+  started = context.connection.info.get("query_started") if context.connection is not None else None
+  if started:
+    started.pop()
+  DB_QUERY_ERRORS.labels(query_source.get()).inc()
+
+
+def instrument_engine(engine, *observers):
+  """Time every statement of an async engine once, for DB_QUERY_SECONDS, the request profile and `observers`.
+
+  Each observer is called as observer(statement, function, seconds), e.g. the slow query log.
+  """
+
+  def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    source = query_source.get()
+    DB_QUERY_SECONDS.labels(source).observe(elapsed)
+    add_timing("db", elapsed)
+    for observer in observers:
+      observer(statement, source, elapsed)
+
+  event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+  event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+  event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+def observe_sqs_message_age(message):
+  sent = message.get("Attributes", {}).get("SentTimestamp")
+  if sent:
+    SQS_MESSAGE_AGE_SECONDS.observe(max(time.time() - int(sent) / 1000, 0))
+
+
+async def monitor_event_loop():
+  """Sample event loop lag: how much later than requested a short sleep returns"""
+  while True:
+    started = time.perf_counter()
+    await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL_SECONDS)
+    lag = max(time.perf_counter() - started - EVENT_LOOP_LAG_INTERVAL_SECONDS, 0)
+    EVENT_LOOP_LAG_SECONDS.observe(lag)
+    EVENT_LOOP_LAG_LAST_SECONDS.set(lag)
+
+
+def render_metrics():
+  """Current metrics in the Prometheus text format, with their content type"""
+  return generate_latest(), CONTENT_TYPE_LATEST
+
+
+async def record_request_metrics(request, call_next):
+  """Middleware timing each request under its route template, so path parameters do not add series"""
+  started = time.perf_counter()
+  status = 500
+  try:
+    response = await call_next(request)
+    status = response.status_code
+    return response
+  finally:
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+      request.method, route.path if route is not None else "unmatched", str(status)
+    ).observe(time.perf_counter() - started)
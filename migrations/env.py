@@ -0,0 +1,44 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+from db.base import Base
+from db.database import DATABASE_URL, engine
+import db.models  # noqa: F401 - registers the tables on Base.metadata
+
+config = context.config
+target_metadata = Base.metadata
+
+# The app passes its own connection and keeps its logging setup
+if config.config_file_name is not None and "connection" not in config.attributes:
+  fileConfig(config.config_file_name)
+
+
+def run_migrations_offline():
+  """Emit the migration SQL without connecting (`alembic upgrade head --sql`)"""
+  context.configure(url=DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+
+  with context.begin_transaction():
+    context.run_migrations()
+
+
+def do_run_migrations(connection):
+  context.configure(connection=connection, target_metadata=target_metadata)
+
+  with context.begin_transaction():
+    context.run_migrations()
+
+
+async def run_migrations_online():
+  async with engine.connect() as connection:
+    await connection.run_sync(do_run_migrations)
+  await engine.dispose()
+
+
+if context.is_offline_mode():
+  run_migrations_offline()
+elif "connection" in config.attributes:
+  do_run_migrations(config.attributes["connection"])
+else:
+  asyncio.run(run_migrations_online())
@@ -0,0 +1,68 @@
+"""Initial schema, as previously created by Base.metadata.create_all
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  # Databases created before migrations already have this schema; only start tracking them
+  if not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table("queues"):
+    return
+
+  op.create_table(
+    "static",
+    sa.Column("key", sa.String(50), nullable=False),
+    sa.Column("value", sa.String(100), nullable=False),
+    sa.Column("type", sa.String(100), nullable=False),
+    sa.PrimaryKeyConstraint("key"),
+  )
+  op.create_index("ix_static_key", "static", ["key"])
+
+  op.create_table(
+    "stores",
+    sa.Column("id", sa.String(), nullable=False),
+    sa.Column("s_id", sa.Integer(), nullable=False),
+    sa.Column("name", sa.String(), nullable=False),
+    sa.Column("alias", sa.String(), nullable=True),
+    sa.Column("deactivated", sa.Boolean(), nullable=False),
+    sa.Column("company_id", sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint("id"),
+  )
+  op.create_index("ix_stores_id", "stores", ["id"])
+  op.create_index("ix_stores_s_id", "stores", ["s_id"])
+
+  op.execute(sa.schema.CreateSequence(sa.Sequence("queue_q_id_seq")))
+  op.create_table(
+    "queues",
+    sa.Column("id", sa.String(), nullable=False),
+    sa.Column("q_id", sa.Integer(), nullable=False),
+    sa.Column("queue_type", sa.String(50), nullable=False),
+    sa.Column("description", sa.String(), nullable=True),
+    sa.Column("status", sa.String(50), nullable=False),
+    sa.Column("capacity", sa.Integer(), nullable=False),
+    sa.Column("deactivated", sa.Boolean(), nullable=False),
+    sa.Column("store_id", sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint("id"),
+    sa.UniqueConstraint("queue_type", "store_id", name="uq_queue_type_store_id"),
+    sa.ForeignKeyConstraint(["queue_type"], ["static.key"], onupdate="CASCADE"),
+    sa.ForeignKeyConstraint(["status"], ["static.key"], onupdate="CASCADE"),
+    sa.ForeignKeyConstraint(["store_id"], ["stores.id"], ondelete="CASCADE"),
+  )
+  op.create_index("ix_queues_q_id", "queues", ["q_id"], unique=True)
+  op.create_index("ix_queues_id", "queues", ["id"])
+
+
+def downgrade():
+  op.drop_table("queues")
+  op.execute(sa.schema.DropSequence(sa.Sequence("queue_q_id_seq")))
+  op.drop_table("stores")
+  op.drop_table("static")
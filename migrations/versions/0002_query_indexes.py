@@ -0,0 +1,36 @@
+"""Index the columns the repository filters on and drop indexes duplicating primary keys
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:30:00
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  # get_queues_by_store_id; uq_queue_type_store_id leads with queue_type and cannot serve it
+  op.create_index("ix_queues_store_id", "queues", ["store_id"])
+  # get_queue_status / get_queue_types
+  op.create_index("ix_static_type", "static", ["type"])
+  # Stores of a company
+  op.create_index("ix_stores_company_id", "stores", ["company_id"])
+
+  # Same column as the primary key: every write paid for a second identical index
+  op.drop_index("ix_queues_id", table_name="queues", if_exists=True)
+  op.drop_index("ix_stores_id", table_name="stores", if_exists=True)
+  op.drop_index("ix_static_key", table_name="static", if_exists=True)
+
+
+def downgrade():
+  op.create_index("ix_static_key", "static", ["key"])
+  op.create_index("ix_stores_id", "stores", ["id"])
+  op.create_index("ix_queues_id", "queues", ["id"])
+
+  op.drop_index("ix_stores_company_id", table_name="stores")
+  op.drop_index("ix_static_type", table_name="static")
+  op.drop_index("ix_queues_store_id", table_name="queues")
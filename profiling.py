@@ -0,0 +1,98 @@
+import asyncio
+import cProfile
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Requests are profiled at PROFILE_SAMPLE_RATE (0-1), or when they send PROFILE_HEADER with the value of PROFILE_TOKEN
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_TOKEN)
+
+# Time spent in the database during the current profiled request, None outside one
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+_profiling = False
+
+
+def add_timing(name: str, seconds: float):
+  """Add to a timing of the current profiled request, if any"""
+  timings = request_timings.get()
+  if timings is not None:
+    timings[name] = timings.get(name, 0.0) + seconds
+    timings[f"{name}Count"] = timings.get(f"{name}Count", 0) + 1
+
+
+def _wants_profile(request) -> bool:
+  if PROFILE_TOKEN and request.headers.get(PROFILE_HEADER) == PROFILE_TOKEN:
+    return True
+  return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _write_profile(profiler: cProfile.Profile, name: str, summary: dict):
+  os.makedirs(PROFILE_DIR, exist_ok=True)
+  path = os.path.join(PROFILE_DIR, name)
+  profiler.dump_stats(f"{path}.prof")
+  with open(f"{path}.json", "w") as file:
+    json.dump(summary, file, indent=2)
+  return f"{path}.prof"
+
+
+async def profile_requests(request, call_next):
+  """Middleware writing a cProfile dump and a timing summary of sampled requests to PROFILE_DIR.
+
+  cProfile sees the whole thread, so functions of concurrent requests can appear in the
+  dump; time awaiting Postgres is not attributed to the awaiting coroutine, which is why
+  the summary also records database and pool wait time. One request is profiled at a time.
+  """
+  global _profiling
+  if _profiling or not _wants_profile(request):
+    return await call_next(request)
+
+  _profiling = True
+  timings = {}
+  token = request_timings.set(timings)
+  profiler = cProfile.Profile()
+  started = time.perf_counter()
+  cpu_started = time.process_time()
+  profiler.enable()
+  try:
+    response = await call_next(request)
+  finally:
+    profiler.disable()
+    request_timings.reset(token)
+    _profiling = False
+
+  wall_ms = (time.perf_counter() - started) * 1000
+  route = request.scope.get("route")
+  summary = {
+    "method": request.method,
+    "path": request.url.path,
+    "route": route.path if route is not None else None,
+    "status": response.status_code,
+    "wallMs": round(wall_ms, 3),
+    "cpuMs": round((time.process_time() - cpu_started) * 1000, 3),
+    "dbMs": round(timings.get("db", 0.0) * 1000, 3),
+    "dbStatements": timings.get("dbCount", 0),
+    "poolWaitMs": round(timings.get("poolWait", 0.0) * 1000, 3),
+    "poolSetupMs": round(timings.get("poolSetup", 0.0) * 1000, 3),
+  }
+  slug = re.sub(r"[^A-Za-z0-9]+", "_", request.url.path).strip("_")
+  name = f"{time.strftime('%Y%m%dT%H%M%S')}-{request.method}-{slug}-{int(wall_ms)}ms"
+  try:
+    path = await asyncio.to_thread(_write_profile, profiler, name, summary)
+  except OSError as e:
+    logger.error(f"⚠️ Failed to write request profile: {str(e)}")
+  else:
+    logger.info(f"🔬 Profiled {request.method} {request.url.path} in {wall_ms:.1f}ms "
+                f"(db {summary['dbMs']}ms, pool wait {summary['poolWaitMs']}ms): {path}")
+  return response
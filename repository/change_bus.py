@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import os
+import uuid
+
+import asyncpg
+import orjson
+
+from config import load_environment
+
+load_environment()
+
+logger = logging.getLogger(__name__)
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# "memory" keeps changes inside this process; "postgres" shares them with every worker through LISTEN/NOTIFY
+CHANGE_BUS = os.getenv("CHANGE_BUS", "postgres" if WEB_CONCURRENCY > 1 else "memory")
+CHANGE_BUS_CHANNEL = os.getenv("CHANGE_BUS_CHANNEL", "queue_mgr_changes")
+CHANGE_BUS_FLUSH_MS = int(os.getenv("CHANGE_BUS_FLUSH_MS", "20"))
+CHANGE_BUS_BATCH_SIZE = int(os.getenv("CHANGE_BUS_BATCH_SIZE", "200"))
+CHANGE_BUS_RECONNECT_SECONDS = float(os.getenv("CHANGE_BUS_RECONNECT_SECONDS", "2"))
+CHANGE_BUS_KEEPALIVE_SECONDS = float(os.getenv("CHANGE_BUS_KEEPALIVE_SECONDS", "30"))
+# NOTIFY payloads must stay under 8000 bytes
+NOTIFY_MAX_BYTES = 7900
+
+
+class ChangeBus:
+  """Publishes row changes to this process at once and to other workers in batches.
+
+  A change is {"kind": "queue" | "store" | "static", "key": ..., "data": ...}. Handlers
+  registered with `subscribe` are called as handler(changes, remote): a local
+  change immediately after the write committed, remote changes per batch. Before a batch goes out,
+  changes to the same (kind, key) are coalesced into the latest one. Every batch
+  carries its worker's origin and a sequence number. A receiver that sees a
+  sequence skip, or that reconnects, may have missed changes, so it calls the
+  resync handlers to drop everything derived from the database.
+
+  This base class delivers batches to the other buses of the same process; it is
+  the backend for tests and single-worker runs.
+  """
+
+  def __init__(self, flush_interval: float, batch_size: int):
+    self.flush_interval = flush_interval
+    self.batch_size = batch_size
+    self.origin = uuid.uuid4().hex[:12]
+    self.peers: list["ChangeBus"] = [self]
+    self._handlers = []
+    self._resync_handlers = []
+    self._pending: dict[tuple, dict] = {}
+    self._timer: asyncio.Task | None = None
+    self._flush_tasks: set[asyncio.Task] = set()
+    self._sequence = 0
+    self._last_seen: dict[str, int] = {}
+    self.published = 0
+    self.coalesced = 0
+    self.batches_sent = 0
+    self.send_failures = 0
+    self.batches_received = 0
+    self.changes_received = 0
+    self.resyncs = 0
+
+  def subscribe(self, handler, resync_handler=None):
+    """Call `handler(changes, remote)` for every change, and `resync_handler()` after changes may have been missed"""
+    self._handlers.append(handler)
+    if resync_handler is not None:
+      self._resync_handlers.append(resync_handler)
+
+  def connect(self, other: "ChangeBus"):
+    """Exchange batches with another in-process bus, as two workers would"""
+    self.peers.append(other)
+    other.peers.append(self)
+
+  @property
+  def shared(self) -> bool:
+    """Whether any other worker receives this bus's batches"""
+    return len(self.peers) > 1
+
+  async def start(self):
+    pass
+
+  async def close(self):
+    """Send what is pending and wait for batches in flight"""
+    if self._pending:
+      self._start_flush()
+    await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+  def publish(self, kind: str, key, data=None):
+    change = {"kind": kind, "key": key, "data": data}
+    self.published += 1
+    self._dispatch([change], False)
+    if not self.shared:
+      return
+
+    if (kind, key) in self._pending:
+      self.coalesced += 1
+      del self._pending[(kind, key)]
+    self._pending[(kind, key)] = change
+    if len(self._pending) >= self.batch_size:
+      self._start_flush()
+    elif self._timer is None:
+      self._timer = asyncio.get_running_loop().create_task(self._flush_later())
+
+  async def _flush_later(self):
+    await asyncio.sleep(self.flush_interval)
+    self._start_flush()
+
+  def _start_flush(self):
+    if self._timer is not None and self._timer is not asyncio.current_task():
+      self._timer.cancel()
+    self._timer = None
+
+    changes, self._pending = list(self._pending.values()), {}
+    task = asyncio.create_task(self._flush(changes))
+    self._flush_tasks.add(task)
+    task.add_done_callback(self._flush_tasks.discard)
+
+  async def _flush(self, changes: list[dict]):
+    for message in self._messages(changes):
+      try:
+        await self._send(message)
+        self.batches_sent += 1
+      except Exception as e:
+        # Receivers notice the skipped sequence number and resync
+        self.send_failures += 1
+        logger.error(f"⚠️ Change bus failed to send a batch: {str(e)}")
+
+  def _messages(self, changes: list[dict]):
+    """Encoded batches, each with its own sequence number"""
+    for start in range(0, len(changes), self.batch_size):
+      self._sequence += 1
+      batch = changes[start:start + self.batch_size]
+      yield orjson.dumps({"origin": self.origin, "seq": self._sequence, "changes": batch})
+
+  async def _send(self, message: bytes):
+    for peer in self.peers:
+      if peer is not self:
+        asyncio.get_running_loop().call_soon(peer._receive, message)
+
+  def _receive(self, message: bytes | str):
+    batch = orjson.loads(message)
+    if batch["origin"] == self.origin:
+      return
+
+    last = self._last_seen.get(batch["origin"])
+    self._last_seen[batch["origin"]] = batch["seq"]
+    if last is not None and batch["seq"] != last + 1:
+      self.resync(f"missed {batch['seq'] - last - 1} batch(es) from worker {batch['origin']}")
+
+    self.batches_received += 1
+    self.changes_received += len(batch["changes"])
+    self._dispatch(batch["changes"], True)
+
+  def _dispatch(self, changes: list[dict], remote: bool):
+    for handler in self._handlers:
+      try:
+        handler(changes, remote)
+      except Exception as e:
+        logger.error(f"⚠️ Change handler failed with exception: {str(e)}")
+
+  def resync(self, reason: str):
+    self.resyncs += 1
+    logger.warning(f"🔄 Change bus resync: {reason}")
+    for handler in self._resync_handlers:
+      try:
+        handler()
+      except Exception as e:
+        logger.error(f"⚠️ Change resync handler failed with exception: {str(e)}")
+
+  def stats(self):
+    return {
+      "backend": "memory",
+      "origin": self.origin,
+      "published": self.published,
+      "coalesced": self.coalesced,
+      "pending": len(self._pending),
+      "batchesSent": self.batches_sent,
+      "sendFailures": self.send_failures,
+      "batchesReceived": self.batches_received,
+      "changesReceived": self.changes_received,
+      "resyncs": self.resyncs,
+    }
+
+
+class PostgresChangeBus(ChangeBus):
+  """Change bus over Postgres LISTEN/NOTIFY on one dedicated connection per worker.
+
+  NOTIFY is only delivered to sessions listening at the time, so a dropped
+  connection is followed by a resync once it is back. The connection is pinged
+  every CHANGE_BUS_KEEPALIVE_SECONDS so a silently dead one is noticed.
+  """
+
+  def __init__(self, connect, channel: str, flush_interval: float, batch_size: int):
+    super().__init__(flush_interval, batch_size)
+    self.connect = connect
+    self.channel = channel
+    self._connection: asyncpg.Connection | None = None
+    self._lock = asyncio.Lock()
+    self._listener: asyncio.Task | None = None
+    self.reconnects = 0
+
+  @property
+  def shared(self) -> bool:
+    return True
+
+  async def start(self):
+    self._listener = asyncio.create_task(self._listen())
+
+  async def close(self):
+    await super().close()
+    if self._listener is not None:
+      self._listener.cancel()
+      await asyncio.gather(self._listener, return_exceptions=True)
+
+  async def _listen(self):
+    connected_before = False
+    while True:
+      lost = asyncio.Event()
+      connection = None
+      try:
+        connection = await self.connect()
+        connection.add_termination_listener(lambda _: lost.set())
+        await connection.add_listener(self.channel, self._on_notify)
+        self._connection = connection
+        if connected_before:
+          self.reconnects += 1
+          self.resync("change bus reconnected")
+        connected_before = True
+        logger.info(f"✅ Change bus listening on {self.channel}")
+        await self._keep_alive(lost)
+      except asyncio.CancelledError:
+        raise
+      except Exception as e:
+        logger.error(f"⚠️ Change bus connection failed: {str(e)}")
+      finally:
+        self._connection = None
+        if connection is not None:
+          connection.terminate()
+      await asyncio.sleep(CHANGE_BUS_RECONNECT_SECONDS)
+
+  async def _keep_alive(self, lost: asyncio.Event):
+    while not lost.is_set():
+      try:
+        await asyncio.wait_for(lost.wait(), CHANGE_BUS_KEEPALIVE_SECONDS)
+      except asyncio.TimeoutError:
+        async with self._lock:
+          await asyncio.wait_for(self._connection.execute("SELECT 1"), CHANGE_BUS_KEEPALIVE_SECONDS)
+
+  def _on_notify(self, connection, pid, channel, payload):
+    self._receive(payload)
+
+  def _messages(self, changes: list[dict]):
+    """Batches split to fit a NOTIFY payload"""
+    batch = []
+    for change in changes:
+      if batch and len(orjson.dumps(batch + [change])) > NOTIFY_MAX_BYTES:
+        yield from super()._messages(batch)
+        batch = []
+      if len(orjson.dumps(change)) > NOTIFY_MAX_BYTES:
+        # Too big to send whole: receivers still invalidate by its keys
+        change = {**change, "data": None}
+      batch.append(change)
+    if batch:
+      yield from super()._messages(batch)
+
+  async def _send(self, message: bytes):
+    if self._connection is None:
+      raise ConnectionError("change bus is not connected")
+    async with self._lock:
+      await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, message.decode())
+
+  def stats(self):
+    return {**super().stats(), "backend": "postgres", "connected": self._connection is not None,
+            "reconnects": self.reconnects}
+
+
+def create_change_bus() -> ChangeBus:
+  flush_interval = CHANGE_BUS_FLUSH_MS / 1000
+  if CHANGE_BUS == "memory":
+    return ChangeBus(flush_interval, CHANGE_BUS_BATCH_SIZE)
+  if CHANGE_BUS != "postgres":
+    raise ValueError(f"Unknown CHANGE_BUS {CHANGE_BUS!r}, expected memory or postgres")
+
+  # Imported here so that the in-memory bus does not need a database URL
+  from db.database import connect_direct
+
+  return PostgresChangeBus(connect_direct, CHANGE_BUS_CHANNEL, flush_interval, CHANGE_BUS_BATCH_SIZE)
+
+
+change_bus = create_change_bus()
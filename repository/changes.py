@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+from db.database import read_session
+from repository.change_bus import change_bus
+from repository.queue_broker import queue_broker
+from repository.queue_cache import queue_cache
+from repository.static_cache import static_cache
+from schemas import queue_to_json
+
+logger = logging.getLogger(__name__)
+
+_reloads: set[asyncio.Task] = set()
+
+
+def publish_queue(row):
+  """Announce a created or updated queue row, after its transaction committed"""
+  change_bus.publish("queue", row.id, queue_to_json(row))
+
+
+def publish_store(store_id: str, **fields):
+  """Announce changed store fields that affect its queues, e.g. deactivated"""
+  change_bus.publish("store", store_id, fields)
+
+
+def publish_static():
+  """Announce that the static table was reloaded"""
+  change_bus.publish("static", "all")
+
+
+async def _load_static():
+  # From the primary: a replica may not have the change yet
+  async with read_session(pinned=True) as db:
+    await static_cache.refresh(db)
+
+
+def _reload_static():
+  task = asyncio.create_task(_load_static())
+  _reloads.add(task)
+  task.add_done_callback(_reloads.discard)
+
+
+def apply_changes(changes: list[dict], remote: bool):
+  """Bring this worker's caches and streams up to date with committed changes"""
+  for change in changes:
+    kind, key, data = change["kind"], change["key"], change["data"]
+    if kind == "queue" and data is not None:
+      queue_cache.invalidate(("id", data["id"]), ("q_id", data["qId"]), ("store", data["storeId"]))
+      queue_broker.publish(data)
+    elif kind == "queue":
+      # Sent without its row: forget the queue wherever it is cached
+      queue_cache.invalidate_queue_id(key)
+      queue_broker.reset(queue_id=key)
+    elif kind == "store":
+      queue_cache.invalidate_store(key)
+      if data:
+        queue_broker.publish_store(key, **data)
+    elif kind == "static" and remote:
+      # The worker that published it has already reloaded
+      _reload_static()
+
+
+def resync():
+  """Changes may have been missed: drop every cached queue, restart streams and reload static data"""
+  queue_cache.clear()
+  queue_broker.reset()
+  _reload_static()
+
+
+change_bus.subscribe(apply_changes, resync)
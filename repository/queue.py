@@ -1,94 +1,377 @@
-from sqlalchemy import select
+from sqlalchemy import Integer, String, any_, bindparam, cast, column, literal_column, or_, select, update, values
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.models import QueueTable
-from schemas import CreateQueue, ModifyQueue, ModifyQueueStatus, ModifyQueueActiveStatus
+from db.models import QueueTable, StaticTable, StoreTable
+from metrics import track_queries
+from repository.changes import publish_queue
+from repository.queue_cache import queue_cache
+from schemas import CreateQueue, ModifyQueue, ModifyQueueStatus, ModifyQueueActiveStatus, QueueResponse
 
+queue_table = QueueTable.__table__
 
+# Reads return plain rows instead of ORM objects. display_id is computed in SQL so that
+# a row carries every QueueResponse field.
+QUEUE_COLUMNS = (*queue_table.c, (literal_column("'Q'", String) + cast(queue_table.c.q_id, String)).label("display_id"))
+
+# The hot lookups are built once; each call only binds its parameters
+QUEUES_BY_STORE_ID = select(*QUEUE_COLUMNS).where(queue_table.c.store_id == bindparam("store_id"))
+QUEUE_BY_ID = select(*QUEUE_COLUMNS).where(queue_table.c.id == bindparam("queue_id"), queue_table.c.deactivated == False)
+QUEUE_BY_Q_ID = select(*QUEUE_COLUMNS).where(queue_table.c.q_id == bindparam("q_id"), queue_table.c.deactivated == False)
+QUEUES_BY_IDS = select(*QUEUE_COLUMNS).where(
+  or_(
+    queue_table.c.id == any_(bindparam("queue_ids", type_=ARRAY(String))),
+    queue_table.c.q_id == any_(bindparam("q_ids", type_=ARRAY(Integer)))
+  ),
+  queue_table.c.deactivated == False
+)
+
+
+@track_queries
 async def create_queue(db: AsyncSession, queue: CreateQueue):
-  """Create a new queue."""
-  db_queue = QueueTable(
-    queue_type=queue.queue_type,
-    description=queue.description,
-    store_id=queue.store_id,
+  """Create a new queue in one statement. Returns None if the store already has a queue of this type."""
+  table = QueueTable.__table__
+  result = await db.execute(
+    insert(table)
+    .values(queue_type=queue.queue_type, description=queue.description, store_id=queue.store_id)
+    .on_conflict_do_nothing(constraint="uq_queue_type_store_id")
+    .returning(*QUEUE_COLUMNS)
   )
-  db.add(db_queue)
+  db_queue = result.one_or_none()
+
+  if db_queue is None:
+    return None
+
   await db.commit()
-  await db.refresh(db_queue)
+  publish_queue(db_queue)
   return db_queue
 
 
-async def get_queue_by_store_id_and_queue_type(db: AsyncSession, queue: CreateQueue):
-  """Retrieve a queue by store ID & queue type."""
-  result = await db.execute(
-    select(QueueTable).filter(QueueTable.queue_type == queue.queue_type, QueueTable.store_id == queue.store_id))
-  return result.scalar_one_or_none()
+@track_queries
+async def create_queues(db: AsyncSession, queues: list[CreateQueue]):
+  """Create many queues with one multi-row INSERT ... ON CONFLICT DO NOTHING.
+
+  Returns a (result, row) pair per item: "created", "exists", or "invalid" for an unknown store or queue type.
+  """
+  stores = await _existing_keys(db, StoreTable.id, {queue.store_id for queue in queues})
+  queue_types = await _existing_keys(
+    db, StaticTable.key, {queue.queue_type for queue in queues}, StaticTable.type == "Queue_Type"
+  )
+
+  rows = {}
+  for queue in queues:
+    if queue.store_id in stores and queue.queue_type in queue_types:
+      rows.setdefault((queue.queue_type, queue.store_id), {
+        "queue_type": queue.queue_type, "description": queue.description, "store_id": queue.store_id
+      })
+
+  created = {}
+  if rows:
+    table = QueueTable.__table__
+    result = await db.execute(
+      insert(table)
+      .values(list(rows.values()))
+      .on_conflict_do_nothing(constraint="uq_queue_type_store_id")
+      .returning(*QUEUE_COLUMNS)
+    )
+    created = {(row.queue_type, row.store_id): row for row in result}
+    await db.commit()
+    for row in created.values():
+      publish_queue(row)
+
+  results = []
+  for queue in queues:
+    key = (queue.queue_type, queue.store_id)
+    if key not in rows:
+      results.append(("invalid", None))
+    elif key in created:
+      # A repeated item in the same batch reports the queue its first copy created
+      results.append(("created", created.pop(key)))
+    else:
+      results.append(("exists", None))
+  return results
 
 
+@track_queries
 async def get_queues_by_store_id(db: AsyncSession, store_id: str):
   """Retrieve list of queue by store id."""
-  result = await db.execute(
-    select(QueueTable).filter(QueueTable.store_id == store_id))
-  return result.scalars().all()
+  result = await db.execute(QUEUES_BY_STORE_ID, {"store_id": store_id})
+  return result.all()
 
 
+@track_queries
 async def get_queue_by_id(db: AsyncSession, queue_id: str):
   """Retrieve a queue by id."""
-  result = await db.execute(select(QueueTable).filter(QueueTable.id == queue_id, QueueTable.deactivated == False))
-  return result.scalar_one_or_none()
+  result = await db.execute(QUEUE_BY_ID, {"queue_id": queue_id})
+  return result.one_or_none()
 
 
+@track_queries
 async def get_queue_by_q_id(db: AsyncSession, q_id: int):
   """Retrieve a queue by q_id."""
-  result = await db.execute(select(QueueTable).filter(QueueTable.q_id == q_id, QueueTable.deactivated == False))
-  return result.scalar_one_or_none()
+  result = await db.execute(QUEUE_BY_Q_ID, {"q_id": q_id})
+  return result.one_or_none()
 
 
-async def edit_queue_details(db: AsyncSession, queue: ModifyQueue):
-  """Edit queue details by its ID."""
-  result = await db.execute(select(QueueTable).filter(QueueTable.id == queue.id))
-  db_queue = result.scalars().first()
+@track_queries
+async def get_queues_by_ids(db: AsyncSession, queue_ids: list[str], q_ids: list[int]):
+  """Retrieve active queues matching any of the ids or q_ids in one query."""
+  result = await db.execute(QUEUES_BY_IDS, {"queue_ids": list(queue_ids), "q_ids": list(q_ids)})
+  return result.all()
 
-  if db_queue is None:
-    return None
 
-  db_queue.queue_type = queue.queue_type
-  db_queue.description = queue.description
-  db_queue.capacity = queue.capacity
+@track_queries
+async def list_queues(
+  db: AsyncSession,
+  company_id: str | None = None,
+  store_id: str | None = None,
+  status: str | None = None,
+  queue_type: str | None = None,
+  deactivated: bool | None = None,
+  after: int | None = None,
+  limit: int = 100
+):
+  """List queues in q_id order after the `after` cursor, with one query. Returns the page and the next cursor."""
+  query = select(*QUEUE_COLUMNS)
+  if company_id is not None:
+    stores = StoreTable.__table__
+    query = query.join(stores, stores.c.id == queue_table.c.store_id).where(stores.c.company_id == company_id)
+  if store_id is not None:
+    query = query.where(queue_table.c.store_id == store_id)
+  if status is not None:
+    query = query.where(queue_table.c.status == status)
+  if queue_type is not None:
+    query = query.where(queue_table.c.queue_type == queue_type)
+  if deactivated is not None:
+    query = query.where(queue_table.c.deactivated == deactivated)
+  if after is not None:
+    query = query.where(queue_table.c.q_id > after)
 
-  await db.commit()
-  await db.refresh(db_queue)
+  # One extra row tells whether there is another page
+  result = await db.execute(query.order_by(queue_table.c.q_id).limit(limit + 1))
+  page = result.all()
 
-  return db_queue
+  if len(page) > limit:
+    return page[:limit], page[limit - 1].q_id
+  return page, None
 
 
-async def edit_queue_status(db: AsyncSession, queue: ModifyQueueStatus):
-  """Edit queue status by its ID."""
-  result = await db.execute(select(QueueTable).filter(QueueTable.id == queue.id))
-  db_queue = result.scalars().first()
+async def _through_cache(db: AsyncSession, key: tuple, load):
+  # Entries may have been loaded from a lagging replica; a client reading its own writes skips them
+  if db.info.get("read_your_writes"):
+    return await load()
+  return await queue_cache.get_or_load(key, load)
+
+
+async def get_cached_queues_by_store_id(db: AsyncSession, store_id: str):
+  """Retrieve list of queue by store id through the queue cache."""
+
+  async def load():
+    return [QueueResponse.model_validate(queue) for queue in await get_queues_by_store_id(db, store_id)]
+
+  return await _through_cache(db, ("store", store_id), load)
+
+
+async def get_cached_queue_by_id(db: AsyncSession, queue_id: str):
+  """Retrieve a queue by id through the queue cache."""
+
+  async def load():
+    queue = await get_queue_by_id(db, queue_id)
+    return QueueResponse.model_validate(queue) if queue else None
+
+  return await _through_cache(db, ("id", queue_id), load)
+
+
+async def get_cached_queue_by_q_id(db: AsyncSession, q_id: int):
+  """Retrieve a queue by q_id through the queue cache."""
+
+  async def load():
+    queue = await get_queue_by_q_id(db, q_id)
+    return QueueResponse.model_validate(queue) if queue else None
+
+  return await _through_cache(db, ("q_id", q_id), load)
+
+
+async def get_cached_queues_by_ids(db: AsyncSession, queue_ids: list[str], q_ids: list[int]):
+  """Retrieve queues by id and q_id through the queue cache, loading all misses with one query.
+
+  Returns a dict keyed by ("id", queue_id) and ("q_id", q_id); queues that were not found are absent.
+  """
+
+  async def load(missing):
+    requested = set(missing)
+    queues = await get_queues_by_ids(
+      db,
+      [value for kind, value in missing if kind == "id"],
+      [value for kind, value in missing if kind == "q_id"]
+    )
+    loaded = {}
+    for queue in queues:
+      response = QueueResponse.model_validate(queue)
+      for key in (("id", queue.id), ("q_id", queue.q_id)):
+        if key in requested:
+          loaded[key] = response
+    return loaded
+
+  keys = [("id", queue_id) for queue_id in queue_ids] + [("q_id", q_id) for q_id in q_ids]
+  if db.info.get("read_your_writes"):
+    return await load(keys)
+  return await queue_cache.get_or_load_many(keys, load)
+
+
+async def _update_queue(db: AsyncSession, queue_id: str, **values):
+  """Update a queue by its ID with a single UPDATE ... RETURNING and return the updated row."""
+  table = QueueTable.__table__
+  result = await db.execute(update(table).where(table.c.id == queue_id).values(**values).returning(*QUEUE_COLUMNS))
+  db_queue = result.one_or_none()
 
   if db_queue is None:
     return None
 
-  db_queue.status = queue.status
-
   await db.commit()
-  await db.refresh(db_queue)
+  publish_queue(db_queue)
 
   return db_queue
 
 
+@track_queries
+async def edit_queue_details(db: AsyncSession, queue: ModifyQueue):
+  """Edit queue details by its ID."""
+  return await _update_queue(
+    db,
+    queue.id,
+    queue_type=queue.queue_type,
+    description=queue.description,
+    capacity=queue.capacity
+  )
+
+
+@track_queries
+async def edit_queue_status(db: AsyncSession, queue: ModifyQueueStatus):
+  """Edit queue status by its ID."""
+  return await _update_queue(db, queue.id, status=queue.status)
+
+
+@track_queries
 async def edit_queue_active_status(db: AsyncSession, queue: ModifyQueueActiveStatus):
   """Edit queue active status by its ID."""
-  result = await db.execute(select(QueueTable).filter(QueueTable.id == queue.id))
-  db_queue = result.scalars().first()
+  return await _update_queue(db, queue.id, deactivated=queue.deactivated)
 
-  if db_queue is None:
-    return None
 
-  db_queue.deactivated = queue.deactivated
+async def _update_queues(db: AsyncSession, rows: dict[str, dict]):
+  """Apply per-queue values with one UPDATE ... FROM (VALUES ...) RETURNING and return the updated rows by ID."""
+  table = QueueTable.__table__
+  columns = list(next(iter(rows.values())))
+  data = values(
+    column("id", String),
+    *(column(name, table.c[name].type) for name in columns),
+    name="data"
+  ).data([(queue_id, *(row[name] for name in columns)) for queue_id, row in rows.items()])
 
+  result = await db.execute(
+    update(table)
+    .where(table.c.id == data.c.id)
+    .values({name: data.c[name] for name in columns})
+    .returning(*QUEUE_COLUMNS)
+  )
+  updated = {row.id: row for row in result}
   await db.commit()
-  await db.refresh(db_queue)
 
-  return db_queue
+  for row in updated.values():
+    publish_queue(row)
+
+  return updated
+
+
+async def _queue_type_conflicts(db: AsyncSession, rows: dict[str, dict]) -> set:
+  """IDs of the edited queues whose new queue_type another queue of their store holds or an earlier edit claims"""
+  table = QueueTable.__table__
+  edited_stores = select(table.c.store_id).where(table.c.id == _any(rows, String))
+  result = await db.execute(
+    select(table.c.id, table.c.queue_type, table.c.store_id).where(table.c.store_id.in_(edited_stores))
+  )
+  queues = result.all()
+  store_ids = {queue.id: queue.store_id for queue in queues}
+  holders = {(queue.queue_type, queue.store_id): queue.id for queue in queues}
+
+  conflicts = set()
+  claimed = {}
+  for queue_id, row in rows.items():
+    # Unknown queues are left to the update, which reports them as not found
+    if queue_id not in store_ids:
+      continue
+    key = (row["queue_type"], store_ids[queue_id])
+    if holders.get(key, queue_id) != queue_id or claimed.setdefault(key, queue_id) != queue_id:
+      conflicts.add(queue_id)
+  return conflicts
+
+
+async def _edit_queues(
+  db: AsyncSession,
+  queues: list,
+  static_field: str,
+  static_type: str,
+  fields: tuple[str, ...],
+  find_conflicts=None
+):
+  """Shared body of the batch edits: validate `static_field` values, update, and pair results with items.
+
+  A `static_field` value is valid only if it is a static key of type `static_type`. Queues that
+  `find_conflicts(db, rows)` returns are reported as conflicts and left unchanged.
+  """
+  valid_keys = await _existing_keys(
+    db, StaticTable.key, {getattr(queue, static_field) for queue in queues}, StaticTable.type == static_type
+  )
+
+  # The last edit for a queue wins, as it would with one request per item
+  rows = {
+    queue.id: {field: getattr(queue, field) for field in fields}
+    for queue in queues if getattr(queue, static_field) in valid_keys
+  }
+  conflicts = await find_conflicts(db, rows) if find_conflicts and rows else set()
+  for queue_id in conflicts:
+    del rows[queue_id]
+  updated = await _update_queues(db, rows) if rows else {}
+
+  results = []
+  for queue in queues:
+    if getattr(queue, static_field) not in valid_keys:
+      results.append(("invalid", None))
+    elif queue.id in conflicts:
+      results.append(("conflict", None))
+    elif queue.id in updated:
+      results.append(("updated", updated[queue.id]))
+    else:
+      results.append(("notFound", None))
+  return results
+
+
+@track_queries
+async def edit_queues_details(db: AsyncSession, queues: list[ModifyQueue]):
+  """Edit many queues' details with one statement.
+
+  Returns an ("updated" | "notFound" | "invalid" | "conflict", row) pair per item. An item conflicts when its
+  queue_type is already used by another queue of the store, or by an earlier item of the batch.
+  """
+  return await _edit_queues(
+    db, queues, "queue_type", "Queue_Type", ("queue_type", "description", "capacity"), _queue_type_conflicts
+  )
+
+
+@track_queries
+async def edit_queues_status(db: AsyncSession, queues: list[ModifyQueueStatus]):
+  """Edit many queues' status with one statement. Returns an ("updated" | "notFound" | "invalid", row) pair per item."""
+  return await _edit_queues(db, queues, "status", "Queue_Status", ("status",))
+
+
+def _any(keys, item_type):
+  """`= ANY(:keys)` as a single array parameter, so the statement is the same for any number of keys"""
+  return any_(bindparam(None, list(keys), type_=ARRAY(item_type)))
+
+
+async def _existing_keys(db: AsyncSession, key_column, keys: set, *criteria) -> set:
+  """Return the subset of `keys` present in `key_column`, among the rows that match `criteria`"""
+  if not keys:
+    return set()
+  result = await db.execute(select(key_column).filter(key_column == _any(keys, String), *criteria))
+  return set(result.scalars().all())
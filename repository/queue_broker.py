@@ -0,0 +1,178 @@
+import asyncio
+import os
+
+import orjson
+
+STREAM_MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", "10000"))
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", "64"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+# Sent as the last frame to a subscriber whose buffer filled up
+DROPPED = b"event: dropped\ndata: {}\n\n"
+
+
+def sse_frame(event: str, data) -> bytes:
+  """One server-sent event with a JSON payload"""
+  return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+class TooManySubscribers(Exception):
+  """STREAM_MAX_CONNECTIONS subscribers are already connected"""
+
+
+class Subscription:
+  """Buffer of encoded frames for one connection, closed for good when it overflows"""
+
+  def __init__(self, buffer_size: int):
+    self.frames = asyncio.Queue(maxsize=buffer_size)
+    self.dropped = False
+
+  def send(self, frame: bytes) -> bool:
+    """Queue a frame; returns False when the buffer is full and the subscriber is dropped instead"""
+    try:
+      self.frames.put_nowait(frame)
+      return True
+    except asyncio.QueueFull:
+      self.drop()
+      return False
+
+  def drop(self):
+    """End the stream: the client reconnects for a new snapshot instead of silently missing changes"""
+    self.dropped = True
+    while not self.frames.empty():
+      self.frames.get_nowait()
+    self.frames.put_nowait(DROPPED)
+
+
+class QueueBroker:
+  """Fans queue changes out to subscribers of a queue or of a store.
+
+  Each change is sent as the fields that differ from the last state the broker
+  published for the queue, so subscribers must see every frame; one whose buffer
+  fills up is dropped and reconnects for a fresh snapshot. State is only kept for
+  queues that somebody watches, and every frame is encoded once for all
+  subscribers.
+  """
+
+  def __init__(self, max_subscribers: int, buffer_size: int):
+    self.max_subscribers = max_subscribers
+    self.buffer_size = buffer_size
+    self._by_queue: dict[str, set[Subscription]] = {}
+    self._by_store: dict[str, set[Subscription]] = {}
+    self._state: dict[str, dict] = {}
+    self.subscribers = 0
+    self.published = 0
+    self.delivered = 0
+    self.dropped = 0
+
+  def full(self) -> bool:
+    return self.subscribers >= self.max_subscribers
+
+  def subscribe(self, kind: str, key: str) -> Subscription:
+    """Register a subscription to a queue ("queue", queue_id) or a store ("store", store_id)"""
+    if self.full():
+      raise TooManySubscribers()
+    subscription = Subscription(self.buffer_size)
+    self._subscriptions(kind).setdefault(key, set()).add(subscription)
+    self.subscribers += 1
+    return subscription
+
+  def unsubscribe(self, kind: str, key: str, subscription: Subscription):
+    subscriptions = self._subscriptions(kind)
+    watchers = subscriptions.get(key)
+    if watchers is None or subscription not in watchers:
+      return
+    watchers.discard(subscription)
+    self.subscribers -= 1
+    if watchers:
+      return
+
+    del subscriptions[key]
+    # Forget state nobody watches any more
+    if kind == "queue":
+      stale = [key]
+    else:
+      stale = [queue_id for queue_id, queue in self._state.items() if queue["storeId"] == key]
+    for queue_id in stale:
+      queue = self._state.get(queue_id)
+      if queue is not None and not self._watched(queue_id, queue["storeId"]):
+        del self._state[queue_id]
+
+  def remember(self, queues: list[dict]):
+    """Seed the diff state from a snapshot, keeping any newer state published meanwhile"""
+    for queue in queues:
+      self._state.setdefault(queue["id"], queue)
+
+  def publish(self, queue: dict):
+    """Send the changed fields of a created or updated queue (as queue_to_json) to its watchers"""
+    watchers = self._by_queue.get(queue["id"], set()) | self._by_store.get(queue["storeId"], set())
+    if not watchers:
+      return
+
+    previous = self._state.get(queue["id"])
+    self._state[queue["id"]] = queue
+    if previous is None:
+      change = queue
+    else:
+      change = {key: value for key, value in queue.items() if previous.get(key) != value}
+      if not change:
+        return
+      change = {"id": queue["id"], "storeId": queue["storeId"], **change}
+    self._fan_out(watchers, sse_frame("queue", change))
+
+  def publish_store(self, store_id: str, **fields):
+    """Send a store change (e.g. deactivation) to the store's watchers and the watchers of its queues"""
+    watchers = set(self._by_store.get(store_id, set()))
+    for queue_id, queue in self._state.items():
+      if queue["storeId"] == store_id:
+        watchers |= self._by_queue.get(queue_id, set())
+    if watchers:
+      self._fan_out(watchers, sse_frame("store", {"storeId": store_id, **fields}))
+
+  def reset(self, queue_id: str | None = None):
+    """Drop the subscribers whose diffs may have gone wrong: all of them, or the watchers of one queue"""
+    if queue_id is None:
+      watchers = set().union(*self._by_queue.values(), *self._by_store.values())
+      self._state.clear()
+    else:
+      queue = self._state.pop(queue_id, None)
+      watchers = set(self._by_queue.get(queue_id, set()))
+      if queue is not None:
+        watchers |= self._by_store.get(queue["storeId"], set())
+
+    for subscription in watchers:
+      if not subscription.dropped:
+        subscription.drop()
+        self.dropped += 1
+
+  def _fan_out(self, watchers: set[Subscription], frame: bytes):
+    self.published += 1
+    for subscription in watchers:
+      if subscription.dropped:
+        continue
+      if subscription.send(frame):
+        self.delivered += 1
+      else:
+        self.dropped += 1
+
+  def _subscriptions(self, kind: str) -> dict[str, set[Subscription]]:
+    return self._by_queue if kind == "queue" else self._by_store
+
+  def _watched(self, queue_id: str, store_id: str) -> bool:
+    return queue_id in self._by_queue or store_id in self._by_store
+
+  def stats(self):
+    return {
+      "subscribers": self.subscribers,
+      "maxSubscribers": self.max_subscribers,
+      "bufferSize": self.buffer_size,
+      "watchedQueues": len(self._by_queue),
+      "watchedStores": len(self._by_store),
+      "trackedQueues": len(self._state),
+      "published": self.published,
+      "delivered": self.delivered,
+      "droppedSubscribers": self.dropped,
+    }
+
+
+queue_broker = QueueBroker(STREAM_MAX_CONNECTIONS, STREAM_BUFFER_SIZE)
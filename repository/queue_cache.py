@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+QUEUE_CACHE_MAX_ENTRIES = int(os.getenv("QUEUE_CACHE_MAX_ENTRIES", "10000"))
+QUEUE_CACHE_TTL_SECONDS = float(os.getenv("QUEUE_CACHE_TTL_SECONDS", "5"))
+
+
+class _LoadAbandoned(Exception):
+  """The request leading a shared load was cancelled before it finished"""
+
+
+class QueueCache:
+  """Bounded LRU + TTL cache of QueueResponse objects.
+
+  Keys are ("id", queue_id), ("q_id", q_id) and ("store", store_id). Concurrent
+  misses for the same key share a single load. Writes invalidate entries precisely
+  through the change bus; with the in-memory bus, writes made by other workers
+  become visible after the TTL.
+  """
+
+  def __init__(self, max_entries: int, ttl: float):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+    self._loading: dict[tuple, asyncio.Future] = {}
+    self._generation = 0
+    self.hits = 0
+    self.misses = 0
+    self.coalesced = 0
+    self.evictions = 0
+    self.expirations = 0
+    self.invalidations = 0
+
+  async def get_or_load(self, key: tuple, loader):
+    """Return the cached value for `key`, or await `loader()` once and cache a non-None result"""
+    value = self._lookup(key)
+    if value is not None:
+      return value
+
+    loading = self._loading.get(key)
+    if loading is not None:
+      self.coalesced += 1
+      try:
+        return await asyncio.shield(loading)
+      except _LoadAbandoned:
+        return await loader()
+
+    future = asyncio.get_running_loop().create_future()
+    self._loading[key] = future
+    generation = self._generation
+    try:
+      value = await loader()
+    except asyncio.CancelledError:
+      future.set_exception(_LoadAbandoned())
+      future.exception()  # mark retrieved when nobody else is waiting
+      raise
+    except Exception as e:
+      future.set_exception(e)
+      future.exception()
+      raise
+    else:
+      future.set_result(value)
+      # A write invalidated entries while this load ran; its result may be stale
+      if value is not None and generation == self._generation:
+        self._store(key, value)
+      return value
+    finally:
+      if self._loading.get(key) is future:
+        del self._loading[key]
+
+  async def get_or_load_many(self, keys: list[tuple], loader) -> dict:
+    """Return {key: value} for the cached and loaded `keys`, fetching every miss with one `loader(missing)` call.
+
+    `loader` returns a dict for the keys it found. Unlike get_or_load, these misses are not
+    shared with concurrent loads of the same keys.
+    """
+    found = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+      value = self._lookup(key)
+      if value is not None:
+        found[key] = value
+      else:
+        missing.append(key)
+
+    if missing:
+      generation = self._generation
+      loaded = await loader(missing)
+      if generation == self._generation:
+        for key, value in loaded.items():
+          self._store(key, value)
+      found.update(loaded)
+    return found
+
+  def _lookup(self, key: tuple):
+    """Return a fresh cached value, or None after counting the miss"""
+    entry = self._entries.get(key)
+    if entry is not None:
+      expires_at, value = entry
+      if expires_at > time.monotonic():
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+      del self._entries[key]
+      self.expirations += 1
+
+    self.misses += 1
+    return None
+
+  def _store(self, key: tuple, value):
+    self._entries[key] = (time.monotonic() + self.ttl, value)
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.max_entries:
+      self._entries.popitem(last=False)
+      self.evictions += 1
+
+  def invalidate(self, *keys: tuple):
+    self._generation += 1
+    for key in keys:
+      self._loading.pop(key, None)
+      if self._entries.pop(key, None) is not None:
+        self.invalidations += 1
+
+  def invalidate_queue_id(self, queue_id: str):
+    """Drop every entry holding the queue when only its ID is known"""
+    keys = [("id", queue_id)]
+    for key, (_, value) in self._entries.items():
+      if key[0] == "store":
+        if any(queue.id == queue_id for queue in value):
+          keys.append(key)
+      elif value.id == queue_id:
+        keys.append(key)
+    self.invalidate(*keys)
+
+  def invalidate_store(self, store_id: str):
+    """Drop the store's queue list and any single-queue entries belonging to it"""
+    keys = [("store", store_id)]
+    for key, (_, value) in self._entries.items():
+      if key[0] != "store" and value.store_id == store_id:
+        keys.append(key)
+    self.invalidate(*keys)
+
+  def clear(self):
+    self._generation += 1
+    self.invalidations += len(self._entries)
+    self._entries.clear()
+    self._loading.clear()
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {
+      "size": len(self._entries),
+      "maxEntries": self.max_entries,
+      "ttlSeconds": self.ttl,
+      "hits": self.hits,
+      "misses": self.misses,
+      "hitRatio": round(self.hits / lookups, 4) if lookups else None,
+      "coalescedLoads": self.coalesced,
+      "evictions": self.evictions,
+      "expirations": self.expirations,
+      "invalidations": self.invalidations,
+    }
+
+
+queue_cache = QueueCache(QUEUE_CACHE_MAX_ENTRIES, QUEUE_CACHE_TTL_SECONDS)
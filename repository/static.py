@@ -1,16 +1,17 @@
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 
 from db.models import StaticTable
+from metrics import track_queries
 
+static_table = StaticTable.__table__
 
-async def get_queue_status(db: AsyncSession):
-  """Get all queue statuses from static table."""
-  result = await db.execute(select(StaticTable).filter(StaticTable.type == "Queue_Status"))
-  return result.scalars().all()
+# Built once and read as plain rows
+ALL_STATIC = select(static_table)
 
 
-async def get_queue_types(db: AsyncSession):
-  """Get all queue types from static table."""
-  result = await db.execute(select(StaticTable).filter(StaticTable.type == "Queue_Type"))
-  return result.scalars().all()
+@track_queries
+async def get_all_static(db: AsyncSession):
+  """Get every record of the static table."""
+  result = await db.execute(ALL_STATIC)
+  return result.all()
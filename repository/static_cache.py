@@ -0,0 +1,79 @@
+import hashlib
+import json
+import logging
+import os
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import read_session
+from repository.static import get_all_static
+
+logger = logging.getLogger(__name__)
+
+STATIC_CACHE_MAX_AGE = int(os.getenv("STATIC_CACHE_MAX_AGE", "300"))
+
+
+class StaticEntry:
+  """Pre-rendered JSON body and strong ETag of one static type"""
+
+  def __init__(self, records: list[dict]):
+    self.records = records
+    self.body = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+
+
+class StaticCache:
+  """In-process copy of the static table, keyed by type.
+
+  The table only changes through `insert_static` at boot, so it is loaded once at
+  startup and reloaded on demand through `refresh`.
+  """
+
+  def __init__(self):
+    self._entries: dict[str, StaticEntry] | None = None
+    self.hits = 0
+    self.misses = 0
+    self.not_modified = 0
+
+  @property
+  def loaded(self) -> bool:
+    return self._entries is not None
+
+  async def load(self):
+    """Load the cache with a read session of its own"""
+    async with read_session() as db:
+      await self.refresh(db)
+
+  async def refresh(self, db: AsyncSession):
+    records = {}
+    for row in await get_all_static(db):
+      records.setdefault(row.type, []).append({"key": row.key, "value": row.value})
+    self._entries = {static_type: StaticEntry(items) for static_type, items in records.items()}
+    logger.info(f"✅ Static cache loaded with {sum(len(items) for items in records.values())} record(s)")
+
+  async def get(self, static_type: str) -> StaticEntry | None:
+    if self._entries is None:
+      self.misses += 1
+      await self.load()
+    else:
+      self.hits += 1
+    return self._entries.get(static_type)
+
+  def stats(self):
+    return {
+      "loaded": self.loaded,
+      "hits": self.hits,
+      "misses": self.misses,
+      "notModified": self.not_modified,
+    }
+
+
+static_cache = StaticCache()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+  """Weak comparison of an If-None-Match header against an ETag, as RFC 9110 requires"""
+  if not if_none_match:
+    return False
+  candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+  return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
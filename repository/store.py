@@ -1,51 +1,41 @@
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from schemas import CreateStore, EditStore, EditStoreStatus
 from db.models import StoreTable
-
-
-async def create_store(db: AsyncSession, store: CreateStore):
-  db_store = StoreTable(
-    id=store.id,
-    s_id=store.s_id,
-    name=store.name,
-    alias=store.alias,
-    company_id=store.company_id
+from metrics import track_queries
+
+
+@track_queries
+async def upsert_stores(db: AsyncSession, stores: list[dict]):
+  """Insert stores, updating existing rows, in one statement. The caller commits."""
+  stmt = insert(StoreTable).values(stores)
+  stmt = stmt.on_conflict_do_update(
+    index_elements=[StoreTable.id],
+    set_={
+      "s_id": stmt.excluded.s_id,
+      "name": stmt.excluded.name,
+      "alias": stmt.excluded.alias,
+      "company_id": stmt.excluded.company_id,
+      # A replayed create event must never reactivate a store
+      "deactivated": or_(StoreTable.deactivated, stmt.excluded.deactivated),
+    }
   )
-  db.add(db_store)
-  await db.commit()
-  await db.refresh(db_store)
-  return db_store
-
-
-async def edit_store(db: AsyncSession, store: EditStore):
-  """Edit the name and alias of a store by its ID."""
-  result = await db.execute(select(StoreTable).filter(StoreTable.id == store.id))
-  db_store = result.scalars().first()
-
-  if db_store is None:
-    return None
-
-  db_store.name = store.name
-  db_store.alias = store.alias
-
-  await db.commit()
-  await db.refresh(db_store)
-
-  return db_store
-
-
-async def edit_store_status(db: AsyncSession, store: EditStoreStatus):
-  """Edit the status of a store by its ID."""
-  result = await db.execute(select(StoreTable).filter(StoreTable.id == store.id))
-  db_store = result.scalars().first()
-
-  if db_store is None:
-    return None
-
-  db_store.deactivated = store.deactivated
-
-  await db.commit()
-  await db.refresh(db_store)
-
-  return db_store
+  await db.execute(stmt)
+
+
+@track_queries
+async def update_stores(db: AsyncSession, stores: list[dict]):
+  """Apply partial updates keyed by store ID, one executemany per column set. The caller commits."""
+  by_columns = {}
+  for store in stores:
+    columns = tuple(sorted(key for key in store if key != "id"))
+    by_columns.setdefault(columns, []).append({f"b_{key}": value for key, value in store.items()})
+
+  table = StoreTable.__table__
+  for columns, params in by_columns.items():
+    stmt = (
+      update(table)
+      .where(table.c.id == bindparam("b_id"))
+      .values({column: bindparam(f"b_{column}") for column in columns})
+    )
+    await db.execute(stmt, params)
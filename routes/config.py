@@ -1,30 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import schemas
 from db.database import get_db
-from repository import static as crud
+from repository.changes import publish_static
+from repository.static_cache import STATIC_CACHE_MAX_AGE, StaticEntry, etag_matches, static_cache
 
 router = APIRouter()
 
 
+def static_response(request: Request, entry: StaticEntry) -> Response:
+  """Serve a cached static entry, answering a matching If-None-Match with 304"""
+  headers = {"ETag": entry.etag, "Cache-Control": f"public, max-age={STATIC_CACHE_MAX_AGE}"}
+  if etag_matches(request.headers.get("if-none-match"), entry.etag):
+    static_cache.not_modified += 1
+    return Response(status_code=304, headers=headers)
+  return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
 @router.get("/queue-status", response_model=list[schemas.ConfigResponse])
-async def get_queue_status(db: AsyncSession = Depends(get_db)):
+async def get_queue_status(request: Request):
   """Retrieve a list of queue statuses"""
-  queue_status = await crud.get_queue_status(db)
+  queue_status = await static_cache.get("Queue_Status")
 
   if not queue_status:
     raise HTTPException(status_code=404, detail="Static queue statuses not found")
 
-  return queue_status
+  return static_response(request, queue_status)
 
 
 @router.get("/queue-types", response_model=list[schemas.ConfigResponse])
-async def get_queue_types(db: AsyncSession = Depends(get_db)):
+async def get_queue_types(request: Request):
   """Retrieve a list of queue types"""
-  queue_types = await crud.get_queue_types(db)
+  queue_types = await static_cache.get("Queue_Type")
 
   if not queue_types:
     raise HTTPException(status_code=404, detail="Static queue types not found")
 
-  return queue_types
+  return static_response(request, queue_types)
+
+
+@router.post("/refresh")
+async def refresh_static_cache(db: AsyncSession = Depends(get_db)):
+  """Reload the static configuration cache from the database"""
+  await static_cache.refresh(db)
+  publish_static()
+
+  return JSONResponse(status_code=200, content={"message": "Static configuration cache refreshed"})
@@ -1,23 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import JSONResponse
+import asyncio
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import schemas
-from db.database import get_db
+from db.database import SessionLocal, engine, get_db, get_read_db
 from repository import queue as crud
-from schemas import CreateQueue
+from repository.queue_broker import (
+  DROPPED,
+  STREAM_HEARTBEAT_SECONDS,
+  Subscription,
+  TooManySubscribers,
+  queue_broker,
+  sse_frame
+)
+from schemas import CreateQueue, queue_to_json
+
+QUEUE_BATCH_MAX_ITEMS = int(os.getenv("QUEUE_BATCH_MAX_ITEMS", "500"))
+QUEUE_LIST_MAX_LIMIT = int(os.getenv("QUEUE_LIST_MAX_LIMIT", "500"))
 
 router = APIRouter()
 
 
+def check_batch_size(size: int):
+  if size > QUEUE_BATCH_MAX_ITEMS:
+    raise HTTPException(status_code=400, detail=f"A batch may contain at most {QUEUE_BATCH_MAX_ITEMS} items")
+
+
 @router.post("/create")
 async def create_queue(queue: CreateQueue, db: AsyncSession = Depends(get_db)):
   """Create a new queue for store"""
-  existing_queue = await crud.get_queue_by_store_id_and_queue_type(db, queue)
-  if existing_queue:
+  new_queue = await crud.create_queue(db, queue)
+  if new_queue is None:
     raise HTTPException(status_code=400, detail=f"{queue.queue_type} queue already exists for store {queue.store_id}")
 
-  new_queue = await crud.create_queue(db, queue)
   return JSONResponse(
     status_code=201,
     content={
@@ -28,34 +48,114 @@ async def create_queue(queue: CreateQueue, db: AsyncSession = Depends(get_db)):
   )
 
 
+@router.post("/create/batch")
+async def create_queues(queues: list[CreateQueue], db: AsyncSession = Depends(get_db)):
+  """Create many queues in one request, reporting a result per item"""
+  check_batch_size(len(queues))
+  results = await crud.create_queues(db, queues)
+
+  return JSONResponse(
+    status_code=200,
+    content={
+      "message": f"{sum(result == 'created' for result, _ in results)} of {len(queues)} queues created",
+      "results": [
+        {
+          "result": result,
+          "id": row.id if row else None,
+          "storeId": queue.store_id,
+          "queueType": queue.queue_type
+        }
+        for queue, (result, row) in zip(queues, results)
+      ]
+    }
+  )
+
+
 @router.get("/get/{store_id}", response_model=list[schemas.QueueResponse])
-async def get_queue(store_id: str, db: AsyncSession = Depends(get_db)):
+async def get_queue(store_id: str, db: AsyncSession = Depends(get_read_db)):
   """Get a list of queues by store id"""
-  queue = await crud.get_queues_by_store_id(db, store_id)
+  queue = await crud.get_cached_queues_by_store_id(db, store_id)
 
-  return queue
+  return ORJSONResponse([queue_to_json(item) for item in queue])
+
+
+@router.get("/list", response_model=schemas.QueuePage)
+async def list_queues(
+  company_id: str | None = None,
+  store_id: str | None = None,
+  status: str | None = None,
+  queue_type: str | None = None,
+  deactivated: bool | None = None,
+  after: int | None = Query(None, description="nextAfter of the previous page"),
+  limit: int = Query(100, ge=1, le=QUEUE_LIST_MAX_LIMIT),
+  db: AsyncSession = Depends(get_read_db)
+):
+  """List queues across stores and companies, one page at a time in q_id order"""
+  queues, next_after = await crud.list_queues(
+    db,
+    company_id=company_id,
+    store_id=store_id,
+    status=status,
+    queue_type=queue_type,
+    deactivated=deactivated,
+    after=after,
+    limit=limit
+  )
+
+  return ORJSONResponse({"queues": [queue_to_json(queue) for queue in queues], "nextAfter": next_after})
 
 
 @router.get("/details/{queue_id}", response_model=schemas.QueueResponse)
-async def get_queue_details(queue_id: str, db: AsyncSession = Depends(get_db)):
+async def get_queue_details(queue_id: str, db: AsyncSession = Depends(get_read_db)):
   """Get a queue details by id"""
-  queue = await crud.get_queue_by_id(db, queue_id)
+  queue = await crud.get_cached_queue_by_id(db, queue_id)
 
   if not queue:
     raise HTTPException(status_code=404, detail="Queue details not found")
 
-  return queue
+  return ORJSONResponse(queue_to_json(queue))
 
 
 @router.get("/details/q_id/{q_id}", response_model=schemas.QueueResponse)
-async def get_queue_details(q_id: int, db: AsyncSession = Depends(get_db)):
+async def get_queue_details(q_id: int, db: AsyncSession = Depends(get_read_db)):
   """Get a queue details by id"""
-  queue = await crud.get_queue_by_q_id(db, q_id)
+  queue = await crud.get_cached_queue_by_q_id(db, q_id)
 
   if not queue:
     raise HTTPException(status_code=404, detail="Queue details not found")
 
-  return queue
+  return ORJSONResponse(queue_to_json(queue))
+
+
+@router.post("/details/batch", response_model=schemas.QueueBatchResponse)
+async def get_queues_details(lookup: schemas.QueueLookup, db: AsyncSession = Depends(get_read_db)):
+  """Get the details of many queues by id and q_id"""
+  check_batch_size(len(lookup.ids) + len(lookup.q_ids))
+  found = await crud.get_cached_queues_by_ids(db, lookup.ids, lookup.q_ids)
+
+  queues = {}
+  for key in [("id", queue_id) for queue_id in lookup.ids] + [("q_id", q_id) for q_id in lookup.q_ids]:
+    if key in found:
+      queues.setdefault(found[key].id, found[key])
+
+  return ORJSONResponse({
+    "queues": [queue_to_json(queue) for queue in queues.values()],
+    "missingIds": [queue_id for queue_id in lookup.ids if ("id", queue_id) not in found],
+    "missingQIds": [q_id for q_id in lookup.q_ids if ("q_id", q_id) not in found]
+  })
+
+
+def batch_edit_response(action: str, queues: list, results: list):
+  return JSONResponse(
+    status_code=200,
+    content={
+      "message": f"{sum(result == 'updated' for result, _ in results)} of {len(queues)} queue {action} updated",
+      "results": [
+        {"result": result, "id": queue.id, "storeId": row.store_id if row else None}
+        for queue, (result, row) in zip(queues, results)
+      ]
+    }
+  )
 
 
 @router.post("/edit/details")
@@ -84,6 +184,28 @@ async def edit_queue_status(queue: schemas.ModifyQueueStatus, db: AsyncSession =
   )
 
 
+@router.post("/edit/details/batch")
+async def edit_queues_details(queues: list[schemas.ModifyQueue], db: AsyncSession = Depends(get_db)):
+  """Edit many queues' details in one request, reporting a result per item"""
+  check_batch_size(len(queues))
+  try:
+    results = await crud.edit_queues_details(db, queues)
+  except IntegrityError:
+    # Clashes are reported per item; this only happens when a concurrent write takes a queue type first
+    raise HTTPException(status_code=409, detail="Batch would give a store two queues of the same type")
+
+  return batch_edit_response("details", queues, results)
+
+
+@router.post("/edit/status/batch")
+async def edit_queues_status(queues: list[schemas.ModifyQueueStatus], db: AsyncSession = Depends(get_db)):
+  """Edit many queues' status in one request, reporting a result per item"""
+  check_batch_size(len(queues))
+  results = await crud.edit_queues_status(db, queues)
+
+  return batch_edit_response("status", queues, results)
+
+
 @router.post("/edit/active-status")
 async def edit_queue_active_status(queue: schemas.ModifyQueueActiveStatus, db: AsyncSession = Depends(get_db)):
   updated_queue = await crud.edit_queue_active_status(db, queue)
@@ -99,3 +221,75 @@ async def edit_queue_active_status(queue: schemas.ModifyQueueActiveStatus, db: A
       "storeId": updated_queue.store_id
     }
   )
+
+
+async def event_stream(kind: str, key: str, subscription: Subscription, load_snapshot):
+  """Send a snapshot read from the primary, then relay the subscription's frames with heartbeats.
+
+  The subscription is made before the snapshot is read so no change falls in between; a change
+  already in the snapshot may be repeated, which a client applying diffs can ignore.
+  """
+  try:
+    async with SessionLocal(bind=engine) as db:
+      snapshot = await load_snapshot(db)
+    if snapshot is None:
+      yield sse_frame("notFound", {"id": key})
+      return
+    yield b"retry: 3000\n\n" + sse_frame("snapshot", snapshot)
+
+    while True:
+      try:
+        frame = await asyncio.wait_for(subscription.frames.get(), STREAM_HEARTBEAT_SECONDS)
+      except asyncio.TimeoutError:
+        yield b": ping\n\n"
+        continue
+      yield frame
+      if frame is DROPPED:
+        return
+  finally:
+    queue_broker.unsubscribe(kind, key, subscription)
+
+
+def stream_response(kind: str, key: str, load_snapshot) -> StreamingResponse:
+  try:
+    subscription = queue_broker.subscribe(kind, key)
+  except TooManySubscribers:
+    raise HTTPException(status_code=503, detail="Too many stream subscribers, retry later")
+
+  return StreamingResponse(
+    event_stream(kind, key, subscription, load_snapshot),
+    media_type="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    # Also unsubscribes when the client disconnects before the stream started
+    background=BackgroundTask(queue_broker.unsubscribe, kind, key, subscription)
+  )
+
+
+@router.get("/stream/store/{store_id}")
+async def stream_store_queues(store_id: str):
+  """Server-sent events for a store's queues: a snapshot, then the changed fields of every queue update"""
+
+  async def load_snapshot(db):
+    queues = [queue_to_json(queue) for queue in await crud.get_queues_by_store_id(db, store_id)]
+    queue_broker.remember(queues)
+    return {"storeId": store_id, "queues": queues}
+
+  return stream_response("store", store_id, load_snapshot)
+
+
+@router.get("/stream/{queue_id}")
+async def stream_queue(queue_id: str, db: AsyncSession = Depends(get_read_db)):
+  """Server-sent events for one queue: a snapshot, then the changed fields of every update"""
+  if not await crud.get_cached_queue_by_id(db, queue_id):
+    raise HTTPException(status_code=404, detail="Queue details not found")
+
+  async def load_snapshot(db):
+    queue = await crud.get_queue_by_id(db, queue_id)
+    if queue is None:
+      return None
+
+    snapshot = queue_to_json(queue)
+    queue_broker.remember([snapshot])
+    return snapshot
+
+  return stream_response("queue", queue_id, load_snapshot)
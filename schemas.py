@@ -30,6 +30,10 @@ class EditStoreStatus(BaseModel):
   deactivated: bool
 
 
+class StoreDeactivateEvent(BaseModel):
+  id: str
+
+
 class CreateQueue(BaseModel):
   queue_type: str
   description: str | None
@@ -68,3 +72,40 @@ class QueueResponse(BaseModel):
     alias_generator = to_camel
     populate_by_name = True
     from_attributes = True
+
+
+# (attribute, JSON key) pairs of QueueResponse, resolved once instead of per response
+QUEUE_RESPONSE_KEYS = tuple((name, field.alias or name) for name, field in QueueResponse.model_fields.items())
+
+
+def queue_to_json(queue) -> dict:
+  """JSON-ready dict of a QueueResponse or queue row, in the field order and camelCase keys of QueueResponse"""
+  return {key: getattr(queue, name) for name, key in QUEUE_RESPONSE_KEYS}
+
+
+class QueueLookup(BaseModel):
+  ids: list[str] = []
+  q_ids: list[int] = []
+
+  class Config:
+    alias_generator = to_camel
+    populate_by_name = True
+
+
+class QueueBatchResponse(BaseModel):
+  queues: list[QueueResponse]
+  missing_ids: list[str]
+  missing_q_ids: list[int]
+
+  class Config:
+    alias_generator = to_camel
+    populate_by_name = True
+
+
+class QueuePage(BaseModel):
+  queues: list[QueueResponse]
+  next_after: int | None
+
+  class Config:
+    alias_generator = to_camel
+    populate_by_name = True
@@ -0,0 +1,92 @@
+import asyncio
+
+from repository.change_bus import ChangeBus
+
+
+def connected_buses():
+  sender = ChangeBus(flush_interval=0.001, batch_size=10)
+  receiver = ChangeBus(flush_interval=0.001, batch_size=10)
+  sender.connect(receiver)
+  return sender, receiver
+
+
+async def deliver(bus: ChangeBus):
+  await bus.close()
+  # In-process peers receive on the next loop iteration
+  await asyncio.sleep(0)
+
+
+def test_local_changes_are_dispatched_at_once_and_remote_ones_coalesced():
+  async def main():
+    sender, receiver = connected_buses()
+    local, remote = [], []
+    sender.subscribe(lambda changes, is_remote: local.append((changes, is_remote)))
+    receiver.subscribe(lambda changes, is_remote: remote.append((changes, is_remote)))
+
+    sender.publish("queue", "q1", {"status": "open"})
+    sender.publish("queue", "q1", {"status": "closed"})
+    sender.publish("store", "s1")
+    assert len(local) == 3
+    await deliver(sender)
+    return local, remote, sender.stats()
+
+  local, remote, stats = asyncio.run(main())
+  assert all(not is_remote for _, is_remote in local)
+  assert remote == [([
+    {"kind": "queue", "key": "q1", "data": {"status": "closed"}},
+    {"kind": "store", "key": "s1", "data": None},
+  ], True)]
+  assert stats["coalesced"] == 1
+  assert stats["batchesSent"] == 1
+
+
+def test_unshared_bus_sends_nothing():
+  async def main():
+    bus = ChangeBus(flush_interval=0.001, batch_size=10)
+    bus.publish("queue", "q1")
+    await deliver(bus)
+    return bus.stats()
+
+  stats = asyncio.run(main())
+  assert stats["published"] == 1
+  assert stats["batchesSent"] == 0
+
+
+def test_skipped_sequence_triggers_resync():
+  async def main():
+    sender, receiver = connected_buses()
+    received, resyncs = [], []
+    receiver.subscribe(lambda changes, remote: received.extend(changes), lambda: resyncs.append(1))
+
+    sender.publish("queue", "q1")
+    await deliver(sender)
+    assert resyncs == []
+
+    # A batch that never arrived
+    sender._sequence += 1
+    sender.publish("queue", "q2")
+    await deliver(sender)
+    return received, resyncs, receiver.stats()
+
+  received, resyncs, stats = asyncio.run(main())
+  assert resyncs == [1]
+  assert stats["resyncs"] == 1
+  # The batch after the gap is still applied
+  assert [change["key"] for change in received] == ["q1", "q2"]
+  assert stats["batchesReceived"] == 2
+
+
+def test_failing_handler_does_not_stop_the_others():
+  async def main():
+    bus = ChangeBus(flush_interval=0.001, batch_size=10)
+    seen = []
+
+    def broken(changes, remote):
+      raise RuntimeError("boom")
+
+    bus.subscribe(broken)
+    bus.subscribe(lambda changes, remote: seen.extend(changes))
+    bus.publish("static", "types")
+    return seen
+
+  assert [change["key"] for change in asyncio.run(main())] == ["types"]
@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+from aws.consumer_election import ConsumerElection, FileLock
+
+
+async def until(condition, timeout=2):
+  deadline = time.monotonic() + timeout
+  while not condition():
+    assert time.monotonic() < deadline, "timed out"
+    await asyncio.sleep(0.005)
+
+
+class SharedSlot:
+  """State of one consumer slot shared by the FakeLocks of several workers"""
+
+  def __init__(self):
+    self.holder = None
+
+
+class FakeLock:
+  """A lock on a SharedSlot whose loss the test triggers"""
+
+  name = "fake"
+
+  def __init__(self, slot: SharedSlot):
+    self.slot = slot
+    self.lost = asyncio.Event()
+    self.closed = False
+
+  async def acquire(self, slots: int) -> int | None:
+    if self.slot.holder is None:
+      self.slot.holder = self
+      return 0
+    return None
+
+  async def wait_lost(self):
+    await self.lost.wait()
+    self.lost.clear()
+
+  async def release(self):
+    if self.slot.holder is self:
+      self.slot.holder = None
+
+  async def close(self):
+    await self.release()
+    self.closed = True
+
+
+def test_standby_takes_over_when_the_consumer_exits(tmp_path):
+  async def main():
+    first = ConsumerElection(FileLock(str(tmp_path), 1), slots=1, retry_interval=0.5)
+    second = ConsumerElection(FileLock(str(tmp_path), 1), slots=1, retry_interval=0.01)
+    consuming = []
+    stop_first = asyncio.Event()
+
+    async def consume(name, stop=None):
+      consuming.append(name)
+      await (stop or asyncio.Event()).wait()
+
+    tasks = [asyncio.create_task(first.run(lambda: consume("first", stop_first)))]
+    await until(lambda: first.role == "consumer")
+    tasks.append(asyncio.create_task(second.run(lambda: consume("second"))))
+    await asyncio.sleep(0.05)
+    assert second.role == "standby"
+
+    # The consumer stops on its own and releases its slot
+    stop_first.set()
+    await until(lambda: second.role == "consumer")
+    assert first.role == "standby"
+
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return consuming, first.stats(), second.stats()
+
+  consuming, first, second = asyncio.run(main())
+  assert consuming == ["first", "second"]
+  assert (first["elections"], second["elections"]) == (1, 1)
+  assert first["lost"] == 0
+
+
+def test_consumer_stops_when_its_lock_is_lost_and_the_standby_takes_over():
+  async def main():
+    slot = SharedSlot()
+    first_lock, second_lock = FakeLock(slot), FakeLock(slot)
+    first = ConsumerElection(first_lock, slots=1, retry_interval=0.5)
+    second = ConsumerElection(second_lock, slots=1, retry_interval=0.01)
+    cancelled = []
+
+    async def consume(name):
+      try:
+        await asyncio.Event().wait()
+      except asyncio.CancelledError:
+        cancelled.append(name)
+        raise
+
+    tasks = [asyncio.create_task(first.run(lambda: consume("first")))]
+    await until(lambda: first.role == "consumer")
+    tasks.append(asyncio.create_task(second.run(lambda: consume("second"))))
+
+    # e.g. the lock's database connection dropped
+    first_lock.lost.set()
+    await until(lambda: second.role == "consumer")
+
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return cancelled, first.stats(), slot.holder, first_lock.closed and second_lock.closed
+
+  cancelled, first, holder, closed = asyncio.run(main())
+  assert cancelled == ["first", "second"]
+  assert first["lost"] == 1
+  assert first["role"] == "standby"
+  # Shutting down releases and closes both locks
+  assert holder is None
+  assert closed
+
+
+def test_failed_acquire_is_retried():
+  class FlakyLock(FakeLock):
+    attempts = 0
+
+    async def acquire(self, slots: int) -> int | None:
+      self.attempts += 1
+      if self.attempts == 1:
+        raise ConnectionError("database is down")
+      return await super().acquire(slots)
+
+  async def main():
+    lock = FlakyLock(SharedSlot())
+    election = ConsumerElection(lock, slots=1, retry_interval=0.01)
+    task = asyncio.create_task(election.run(asyncio.Event().wait))
+    await until(lambda: election.role == "consumer")
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return lock.attempts
+
+  assert asyncio.run(main()) == 2
@@ -0,0 +1,140 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import ScalarSelect, Select
+from sqlalchemy.sql.elements import BindParameter, BooleanClauseList, CollectionAggregate
+
+from repository import queue as crud
+from schemas import CreateQueue, ModifyQueue, ModifyQueueStatus
+
+STATIC = [
+  {"key": "Open", "value": "Open", "type": "Queue_Status"},
+  {"key": "Closed", "value": "Closed", "type": "Queue_Status"},
+  {"key": "Virtual", "value": "Virtual", "type": "Queue_Type"},
+  {"key": "Physical", "value": "Physical", "type": "Queue_Type"},
+]
+
+
+def _value(expression):
+  while not isinstance(expression, BindParameter):
+    expression = expression.element
+  return expression.value
+
+
+class _Result:
+  def __init__(self, rows: list[dict], columns: list[str]):
+    self.rows = [SimpleNamespace(**{name: row[name] for name in columns}) for row in rows]
+    self.columns = columns
+
+  def all(self):
+    return self.rows
+
+  def scalars(self):
+    return SimpleNamespace(all=lambda: [getattr(row, self.columns[0]) for row in self.rows])
+
+  def __iter__(self):
+    return iter(self.rows)
+
+
+class FakeSession:
+  """Answers the repository's SELECTs from in-memory rows; filters may only use =, = ANY(...) and IN (SELECT ...)"""
+
+  def __init__(self, **tables: list[dict]):
+    self.tables = tables
+
+  async def execute(self, statement):
+    assert isinstance(statement, Select), f"unexpected {statement.__visit_name__} statement"
+    return _Result(self._select(statement), [column.name for column in statement.selected_columns])
+
+  def _select(self, statement: Select) -> list[dict]:
+    rows = self.tables[statement.get_final_froms()[0].name]
+    if statement.whereclause is None:
+      return rows
+    return [row for row in rows if self._matches(row, statement.whereclause)]
+
+  def _matches(self, row: dict, criterion) -> bool:
+    if isinstance(criterion, BooleanClauseList):
+      return all(self._matches(row, clause) for clause in criterion.clauses)
+    if isinstance(criterion.right, ScalarSelect):
+      subquery = criterion.right.element
+      column = subquery.selected_columns[0].name
+      return row[criterion.left.name] in {selected[column] for selected in self._select(subquery)}
+    value = _value(criterion.right)
+    if isinstance(criterion.right, CollectionAggregate):
+      return row[criterion.left.name] in value
+    return row[criterion.left.name] == value
+
+  async def commit(self):
+    pass
+
+
+@pytest.fixture
+def applied(monkeypatch):
+  """Rows passed to the batch UPDATE, which updates the ones in the session's queues table"""
+  applied = {}
+
+  async def update_queues(db, rows):
+    applied.update(rows)
+    return {
+      queue["id"]: SimpleNamespace(id=queue["id"], store_id=queue["store_id"])
+      for queue in db.tables["queues"] if queue["id"] in rows
+    }
+
+  monkeypatch.setattr(crud, "_update_queues", update_queues)
+  return applied
+
+
+def test_create_rejects_a_status_as_queue_type():
+  db = FakeSession(static=STATIC, stores=[{"id": "store-1"}])
+  results = asyncio.run(crud.create_queues(db, [
+    CreateQueue(queue_type="Open", description=None, store_id="store-1"),
+    CreateQueue(queue_type="Unknown", description=None, store_id="store-1"),
+  ]))
+  assert [result for result, _ in results] == ["invalid", "invalid"]
+
+
+def test_edits_reject_static_keys_of_the_other_kind(applied):
+  db = FakeSession(static=STATIC, queues=[
+    {"id": f"q{n}", "queue_type": "Virtual", "store_id": f"store-{n}"} for n in range(1, 5)
+  ])
+  details = asyncio.run(crud.edit_queues_details(db, [
+    ModifyQueue(id="q1", queue_type="Closed", description=None, capacity=5),
+    ModifyQueue(id="q2", queue_type="Physical", description=None, capacity=5),
+  ]))
+  statuses = asyncio.run(crud.edit_queues_status(db, [
+    ModifyQueueStatus(id="q3", status="Virtual"),
+    ModifyQueueStatus(id="q4", status="Open"),
+  ]))
+
+  assert [result for result, _ in details] == ["invalid", "updated"]
+  assert [result for result, _ in statuses] == ["invalid", "updated"]
+  assert sorted(applied) == ["q2", "q4"]
+
+
+def test_queue_type_clashes_are_reported_per_item(applied):
+  db = FakeSession(
+    static=STATIC + [{"key": "Express", "value": "Express", "type": "Queue_Type"}],
+    queues=[
+      {"id": "q1", "queue_type": "Virtual", "store_id": "store-1"},
+      {"id": "q2", "queue_type": "Physical", "store_id": "store-1"},
+      {"id": "q3", "queue_type": "Virtual", "store_id": "store-2"},
+      {"id": "q4", "queue_type": "Virtual", "store_id": "store-3"},
+      {"id": "q5", "queue_type": "Physical", "store_id": "store-3"},
+    ]
+  )
+
+  def edit(queue_id, queue_type):
+    return ModifyQueue(id=queue_id, queue_type=queue_type, description="edited", capacity=5)
+
+  results = asyncio.run(crud.edit_queues_details(db, [
+    edit("q1", "Physical"),  # q2 keeps Physical
+    edit("q2", "Physical"),  # unchanged type
+    edit("q3", "Physical"),  # free in store-2
+    edit("q4", "Express"),   # free in store-3 ...
+    edit("q5", "Express"),   # ... but q4 claims it first
+    edit("q9", "Virtual"),   # no such queue
+  ]))
+
+  assert [result for result, _ in results] == ["conflict", "updated", "updated", "updated", "conflict", "notFound"]
+  assert sorted(applied) == ["q2", "q3", "q4", "q9"]
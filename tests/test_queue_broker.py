@@ -0,0 +1,137 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from repository.queue_broker import DROPPED, QueueBroker, TooManySubscribers
+from routes import queue as queue_routes
+
+OPEN = {"id": "q1", "storeId": "store-1", "status": "Open", "capacity": 10}
+
+
+def frames(subscription) -> list:
+  """Drain a subscription's buffer into (event, data) pairs"""
+  received = []
+  while not subscription.frames.empty():
+    received.append(parse(subscription.frames.get_nowait()))
+  return received
+
+
+def parse(frame: bytes):
+  if frame is DROPPED:
+    return "dropped", {}
+  event, data = frame.decode().strip().split("\n")[-2:]
+  return event.removeprefix("event: "), orjson.loads(data.removeprefix("data: "))
+
+
+def test_sends_only_changed_fields():
+  broker = QueueBroker(max_subscribers=10, buffer_size=8)
+  subscription = broker.subscribe("store", "store-1")
+
+  broker.publish(OPEN)
+  broker.publish({**OPEN, "status": "Closed"})
+  broker.publish({**OPEN, "status": "Closed"})
+
+  assert frames(subscription) == [
+    ("queue", OPEN),
+    ("queue", {"id": "q1", "storeId": "store-1", "status": "Closed"}),
+  ]
+
+
+def test_snapshot_does_not_overwrite_newer_published_state():
+  broker = QueueBroker(max_subscribers=10, buffer_size=8)
+  subscription = broker.subscribe("queue", "q1")
+
+  # A change is published while the snapshot, read before it, is still on its way
+  broker.publish({**OPEN, "status": "Closed"})
+  broker.remember([OPEN])
+  broker.publish({**OPEN, "status": "Closed", "capacity": 20})
+
+  assert frames(subscription) == [
+    ("queue", {**OPEN, "status": "Closed"}),
+    ("queue", {"id": "q1", "storeId": "store-1", "capacity": 20}),
+  ]
+
+
+def test_full_buffer_drops_the_subscriber():
+  broker = QueueBroker(max_subscribers=10, buffer_size=2)
+  slow = broker.subscribe("queue", "q1")
+  fast = broker.subscribe("queue", "q1")
+
+  for capacity in range(3):
+    broker.publish({**OPEN, "capacity": capacity})
+    frames(fast)
+  broker.publish({**OPEN, "capacity": 99})
+
+  # The dropped subscriber gets nothing but the final frame and reconnects for a snapshot
+  assert slow.dropped
+  assert frames(slow) == [("dropped", {})]
+  assert frames(fast) == [("queue", {"id": "q1", "storeId": "store-1", "capacity": 99})]
+  assert broker.stats()["droppedSubscribers"] == 1
+
+
+def test_subscriber_limit():
+  broker = QueueBroker(max_subscribers=1, buffer_size=8)
+  subscription = broker.subscribe("queue", "q1")
+  with pytest.raises(TooManySubscribers):
+    broker.subscribe("store", "store-1")
+
+  broker.unsubscribe("queue", "q1", subscription)
+  broker.unsubscribe("queue", "q1", subscription)
+  assert broker.stats()["subscribers"] == 0
+  broker.subscribe("store", "store-1")
+
+
+def test_unwatched_queue_state_is_forgotten():
+  broker = QueueBroker(max_subscribers=10, buffer_size=8)
+  by_queue = broker.subscribe("queue", "q1")
+  by_store = broker.subscribe("store", "store-1")
+  broker.publish(OPEN)
+
+  broker.unsubscribe("store", "store-1", by_store)
+  assert broker.stats()["trackedQueues"] == 1
+  broker.unsubscribe("queue", "q1", by_queue)
+  assert broker.stats()["trackedQueues"] == 0
+
+
+def test_stream_relays_changes_made_before_the_snapshot_is_read(monkeypatch):
+  broker = QueueBroker(max_subscribers=10, buffer_size=8)
+  monkeypatch.setattr(queue_routes, "queue_broker", broker)
+
+  async def load_snapshot(db):
+    # The snapshot holds the state before a write that commits while it is read
+    broker.publish({**OPEN, "status": "Closed", "capacity": 20})
+    broker.remember([OPEN])
+    return OPEN
+
+  async def main():
+    response = queue_routes.stream_response("queue", "q1", load_snapshot)
+    # A write that commits before the server starts sending the stream
+    broker.publish({**OPEN, "status": "Closed"})
+    stream = response.body_iterator
+    try:
+      return [parse(await anext(stream)) for _ in range(3)]
+    finally:
+      await stream.aclose()
+
+  assert asyncio.run(main()) == [
+    ("snapshot", OPEN),
+    ("queue", {**OPEN, "status": "Closed"}),
+    ("queue", {"id": "q1", "storeId": "store-1", "capacity": 20}),
+  ]
+  assert broker.stats()["subscribers"] == 0
+
+
+def test_stream_holds_its_subscriber_slot_from_the_response(monkeypatch):
+  broker = QueueBroker(max_subscribers=1, buffer_size=8)
+  monkeypatch.setattr(queue_routes, "queue_broker", broker)
+
+  response = queue_routes.stream_response("queue", "q1", None)
+  with pytest.raises(HTTPException) as error:
+    queue_routes.stream_response("queue", "q1", None)
+  assert error.value.status_code == 503
+
+  # A client that disconnects before the stream starts still frees the slot
+  asyncio.run(response.background())
+  assert broker.stats()["subscribers"] == 0
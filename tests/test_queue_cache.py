@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace
+
+from repository.queue_cache import QueueCache
+
+
+def queue(id, store_id="store-1"):
+  return SimpleNamespace(id=id, store_id=store_id)
+
+
+def test_loads_once_and_then_hits():
+  loads = []
+
+  async def loader():
+    loads.append(1)
+    return queue("q1")
+
+  async def main():
+    cache = QueueCache(max_entries=10, ttl=60)
+    first = await cache.get_or_load(("id", "q1"), loader)
+    second = await cache.get_or_load(("id", "q1"), loader)
+    return first, second, cache.stats()
+
+  first, second, stats = asyncio.run(main())
+  assert first is second
+  assert len(loads) == 1
+  assert stats["hits"] == 1
+  assert stats["misses"] == 1
+
+
+def test_concurrent_misses_share_one_load():
+  loads = []
+
+  async def loader():
+    loads.append(1)
+    await asyncio.sleep(0.01)
+    return queue("q1")
+
+  async def main():
+    cache = QueueCache(max_entries=10, ttl=60)
+    results = await asyncio.gather(*(cache.get_or_load(("id", "q1"), loader) for _ in range(5)))
+    return results, cache.stats()
+
+  results, stats = asyncio.run(main())
+  assert len(loads) == 1
+  assert all(result is results[0] for result in results)
+  assert stats["coalescedLoads"] == 4
+
+
+def test_load_finishing_after_an_invalidation_is_not_cached():
+  async def main():
+    cache = QueueCache(max_entries=10, ttl=60)
+    started = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def stale_loader():
+      started.set()
+      await finish.wait()
+      return queue("q1")
+
+    load = asyncio.create_task(cache.get_or_load(("id", "q1"), stale_loader))
+    await started.wait()
+    cache.invalidate(("id", "q1"))
+    finish.set()
+    value = await load
+    return value, cache.stats()
+
+  value, stats = asyncio.run(main())
+  assert value.id == "q1"
+  assert stats["size"] == 0
+
+
+def test_load_many_after_an_invalidation_is_not_cached():
+  async def main():
+    cache = QueueCache(max_entries=10, ttl=60)
+
+    async def loader(keys):
+      cache.invalidate(("id", "other"))
+      return {key: queue(key[1]) for key in keys}
+
+    found = await cache.get_or_load_many([("id", "q1"), ("id", "q2")], loader)
+    return found, cache.stats()
+
+  found, stats = asyncio.run(main())
+  assert sorted(found) == [("id", "q1"), ("id", "q2")]
+  assert stats["size"] == 0
+
+
+def test_invalidate_queue_id_drops_every_entry_holding_the_queue():
+  async def main():
+    cache = QueueCache(max_entries=10, ttl=60)
+    q1, q2 = queue("q1"), queue("q2")
+
+    async def load(value):
+      return value
+
+    await cache.get_or_load(("id", "q1"), lambda: load(q1))
+    await cache.get_or_load(("q_id", "Q-1"), lambda: load(q1))
+    await cache.get_or_load(("store", "store-1"), lambda: load([q1, q2]))
+    await cache.get_or_load(("id", "q2"), lambda: load(q2))
+    cache.invalidate_queue_id("q1")
+    return set(cache._entries), cache.stats()
+
+  keys, stats = asyncio.run(main())
+  assert keys == {("id", "q2")}
+  assert stats["invalidations"] == 3
+
+
+def test_invalidate_store_drops_its_list_and_queues():
+  async def main():
+    cache = QueueCache(max_entries=10, ttl=60)
+    mine, other = queue("q1", "store-1"), queue("q2", "store-2")
+
+    async def load(value):
+      return value
+
+    await cache.get_or_load(("store", "store-1"), lambda: load([mine]))
+    await cache.get_or_load(("id", "q1"), lambda: load(mine))
+    await cache.get_or_load(("id", "q2"), lambda: load(other))
+    cache.invalidate_store("store-1")
+    return set(cache._entries)
+
+  assert asyncio.run(main()) == {("id", "q2")}
+
+
+def test_evicts_least_recently_used_entry():
+  async def main():
+    cache = QueueCache(max_entries=2, ttl=60)
+
+    async def load(id):
+      return queue(id)
+
+    await cache.get_or_load(("id", "q1"), lambda: load("q1"))
+    await cache.get_or_load(("id", "q2"), lambda: load("q2"))
+    await cache.get_or_load(("id", "q1"), lambda: load("q1"))
+    await cache.get_or_load(("id", "q3"), lambda: load("q3"))
+    return set(cache._entries), cache.stats()
+
+  keys, stats = asyncio.run(main())
+  assert keys == {("id", "q1"), ("id", "q3")}
+  assert stats["evictions"] == 1
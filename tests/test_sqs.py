@@ -0,0 +1,216 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from aws import sqs, store_events
+from aws.client import set_sqs_client
+from aws.local_sqs import LocalSQSClient
+from aws.store_writer import StoreEventWriter
+from aws.workers import KeyedWorkerPool
+
+
+class RecordingWriter(StoreEventWriter):
+  """Store writer that records each batch instead of writing it"""
+
+  def __init__(self, batch_size=100, flush_interval=0.05, commit_seconds=0.002):
+    super().__init__(batch_size, flush_interval)
+    self.commit_seconds = commit_seconds
+    self.batches = []
+
+  async def _apply(self, pending: dict):
+    self.batches.append(len(pending))
+    await asyncio.sleep(self.commit_seconds)
+
+
+@pytest.fixture
+def consumer(monkeypatch):
+  """A LocalSQSClient wired into the consumer, with a fresh worker pool and a recording writer"""
+  client = LocalSQSClient()
+  writer = RecordingWriter()
+  set_sqs_client(client)
+  monkeypatch.setattr(store_events, "store_writer", writer)
+  monkeypatch.setattr(sqs, "store_writer", writer)
+  monkeypatch.setattr(sqs, "worker_pool", KeyedWorkerPool(sqs.SQS_WORKER_CONCURRENCY, sqs.SQS_MAX_PENDING_MESSAGES))
+  yield client, writer
+  set_sqs_client(None)
+
+
+def send_events(client, events):
+  for start in range(0, len(events), 10):
+    client.send_message_batch(QueueUrl=sqs.AWS_SQS_QUEUE_URL, Entries=[
+      {"Id": str(i), "MessageBody": json.dumps(body), "MessageGroupId": group}
+      for i, (group, body) in enumerate(events[start:start + 10])
+    ])
+
+
+def create_event(n):
+  return "store-create-event", {"id": f"store-{n:04d}", "s_id": n, "name": f"Store {n}", "alias": "ST",
+                                "company_id": "company-1"}
+
+
+async def drain(client, timeout=10):
+  """Run the consumer until the queue is empty"""
+  poller = asyncio.create_task(sqs.poll_sqs())
+  started = time.monotonic()
+  try:
+    while client.depth(sqs.AWS_SQS_QUEUE_URL) and time.monotonic() - started < timeout:
+      await asyncio.sleep(0.005)
+  finally:
+    poller.cancel()
+    await asyncio.gather(poller, return_exceptions=True)
+
+
+def test_each_receive_commits_in_one_transaction(consumer):
+  client, writer = consumer
+  # One message group: every receive takes 10 messages, the next waits until they are deleted
+  send_events(client, [create_event(n) for n in range(100)])
+
+  asyncio.run(drain(client))
+
+  assert client.depth(sqs.AWS_SQS_QUEUE_URL) == 0
+  # Not capped at SQS_WORKER_CONCURRENCY rows, and not split across transactions
+  assert sqs.SQS_WORKER_CONCURRENCY < 10
+  assert writer.batches == [10] * 10
+
+
+def test_concurrent_receives_share_transactions(consumer):
+  client, writer = consumer
+  # A FIFO group is blocked while a batch of it is in flight, so three groups give three concurrent batches
+  events = [create_event(n) for n in range(200)]
+  events += [("store-update-event", {"id": f"store-{n:04d}", "name": f"Store {n}", "alias": "ST"}) for n in range(200, 400)]
+  events += [("store-deactivate-event", {"id": f"store-{n:04d}"}) for n in range(400, 600)]
+  send_events(client, events)
+  receives = 0
+  receive_message = client.receive_message
+
+  def counting_receive(**kwargs):
+    nonlocal receives
+    response = receive_message(**kwargs)
+    receives += bool(response.get("Messages"))
+    return response
+
+  client.receive_message = counting_receive
+
+  asyncio.run(drain(client))
+
+  stats = writer.stats()
+  assert client.depth(sqs.AWS_SQS_QUEUE_URL) == 0
+  assert client.depth(sqs.AWS_SQS_DLQ_URL) == 0
+  assert stats["events"] == len(events)
+  assert stats["failedEvents"] == 0
+  # Batches received while a commit runs are cut together once it finishes
+  assert len(writer.batches) <= receives
+  assert max(writer.batches) > sqs.AWS_SQS_MAX_MESSAGES
+
+
+@pytest.fixture
+def local_sqs():
+  """A LocalSQSClient that records the visibility timeout given to each receipt handle"""
+  client = LocalSQSClient()
+  client.visibility_timeouts = {}
+  change_message_visibility_batch = client.change_message_visibility_batch
+
+  def recording_change(QueueUrl, Entries, **kwargs):
+    for entry in Entries:
+      client.visibility_timeouts[entry["ReceiptHandle"]] = entry["VisibilityTimeout"]
+    return change_message_visibility_batch(QueueUrl=QueueUrl, Entries=Entries, **kwargs)
+
+  client.change_message_visibility_batch = recording_change
+  set_sqs_client(client)
+  yield client
+  set_sqs_client(None)
+
+
+def receive(client):
+  return client.receive_message(QueueUrl=sqs.AWS_SQS_QUEUE_URL, MaxNumberOfMessages=10)["Messages"]
+
+
+def test_retry_delay_doubles_up_to_the_cap(monkeypatch):
+  monkeypatch.setattr(sqs, "SQS_RETRY_BASE_SECONDS", 5)
+  monkeypatch.setattr(sqs, "SQS_RETRY_MAX_SECONDS", 60)
+  assert [sqs.retry_delay(count) for count in range(1, 7)] == [5, 10, 20, 40, 60, 60]
+  # SQS rejects visibility timeouts above 12 hours whatever the configured maximum
+  monkeypatch.setattr(sqs, "SQS_RETRY_MAX_SECONDS", 10 ** 6)
+  assert sqs.retry_delay(30) == sqs.AWS_SQS_MAX_VISIBILITY_TIMEOUT
+
+
+def test_failed_message_backs_off_until_its_retries_run_out(local_sqs, monkeypatch):
+  monkeypatch.setattr(sqs, "MAX_RETRIES", 3)
+  monkeypatch.setattr(sqs, "SQS_RETRY_BASE_SECONDS", 5)
+  send_events(local_sqs, [create_event(1)])
+
+  delays = []
+  for _ in range(3):
+    message, = receive(local_sqs)
+    asyncio.run(sqs.settle_failed_messages([(message, True)]))
+    delays.append(local_sqs.visibility_timeouts.get(message["ReceiptHandle"]))
+    if local_sqs.depth(sqs.AWS_SQS_QUEUE_URL):
+      # Let the backoff expire at once
+      local_sqs.change_message_visibility(
+        QueueUrl=sqs.AWS_SQS_QUEUE_URL, ReceiptHandle=message["ReceiptHandle"], VisibilityTimeout=0
+      )
+
+  # The third attempt used up the budget: the message moved to the DLQ instead of backing off again
+  assert delays == [5, 10, None]
+  assert local_sqs.depth(sqs.AWS_SQS_QUEUE_URL) == 0
+  assert local_sqs.depth(sqs.AWS_SQS_DLQ_URL) == 1
+
+
+def test_skipped_messages_are_not_dead_lettered(local_sqs, monkeypatch):
+  monkeypatch.setattr(sqs, "MAX_RETRIES", 1)
+  send_events(local_sqs, [create_event(1), create_event(2)])
+  attempted, skipped = receive(local_sqs)
+
+  # The first event of the group failed; the second one was never attempted
+  asyncio.run(sqs.settle_failed_messages([(attempted, True), (skipped, False)]))
+
+  assert local_sqs.depth(sqs.AWS_SQS_DLQ_URL) == 1
+  assert local_sqs.depth(sqs.AWS_SQS_QUEUE_URL) == 1
+  assert local_sqs.visibility_timeouts == {skipped["ReceiptHandle"]: sqs.retry_delay(1)}
+
+
+def test_rejected_messages_are_dead_lettered_at_once(local_sqs):
+  send_events(local_sqs, [create_event(1)])
+  message, = receive(local_sqs)
+
+  asyncio.run(sqs.settle_failed_messages([], [message]))
+
+  assert local_sqs.depth(sqs.AWS_SQS_QUEUE_URL) == 0
+  assert local_sqs.depth(sqs.AWS_SQS_DLQ_URL) == 1
+
+
+def test_without_a_dlq_exhausted_messages_keep_backing_off_at_the_maximum(local_sqs, monkeypatch):
+  dlq_url = sqs.AWS_SQS_DLQ_URL
+  monkeypatch.setattr(sqs, "AWS_SQS_DLQ_URL", None)
+  monkeypatch.setattr(sqs, "MAX_RETRIES", 1)
+  send_events(local_sqs, [create_event(1), create_event(2)])
+  exhausted, rejected = receive(local_sqs)
+
+  asyncio.run(sqs.settle_failed_messages([(exhausted, True)], [rejected]))
+
+  longest = min(sqs.SQS_RETRY_MAX_SECONDS, sqs.AWS_SQS_MAX_VISIBILITY_TIMEOUT)
+  assert local_sqs.visibility_timeouts == {exhausted["ReceiptHandle"]: longest, rejected["ReceiptHandle"]: longest}
+  assert local_sqs.depth(sqs.AWS_SQS_QUEUE_URL) == 2
+  assert local_sqs.depth(dlq_url) == 0
+
+
+def test_failed_writes_are_logged_and_retried(consumer, caplog):
+  client, writer = consumer
+
+  async def failing_apply(pending):
+    raise ConnectionError("database is down")
+
+  writer._apply = failing_apply
+  send_events(client, [
+    create_event(1),
+    ("store-update-event", {"id": "store-0001", "name": "Store 1 v2", "alias": "ST"}),
+  ])
+  messages = receive(client)
+
+  asyncio.run(sqs.handle_messages(messages))
+
+  assert "2 store-create-event, store-update-event event(s) for store:store-0001 failed, 0 skipped" in caplog.text
+  assert client.depth(sqs.AWS_SQS_QUEUE_URL) == 2
+  assert client.depth(sqs.AWS_SQS_DLQ_URL) == 0
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from aws.workers import KeyedWorkerPool
+
+
+def test_jobs_run_in_submission_order_within_a_key():
+  async def main():
+    pool = KeyedWorkerPool(concurrency=4, max_pending=100)
+    finished = []
+
+    async def job(key, index, delay):
+      await asyncio.sleep(delay)
+      finished.append((key, index))
+
+    futures = [
+      pool.submit(key, job, key, index, 0.005 * (3 - index))
+      for index in range(3)
+      for key in ("a", "b")
+    ]
+    await asyncio.gather(*futures)
+    return finished
+
+  finished = asyncio.run(main())
+  assert [index for key, index in finished if key == "a"] == [0, 1, 2]
+  assert [index for key, index in finished if key == "b"] == [0, 1, 2]
+
+
+def test_a_slow_key_does_not_block_other_keys():
+  async def main():
+    pool = KeyedWorkerPool(concurrency=2, max_pending=100)
+    release = asyncio.Event()
+
+    async def blocked():
+      await release.wait()
+
+    async def quick():
+      return "done"
+
+    slow = pool.submit("a", blocked)
+    result = await asyncio.wait_for(pool.submit("b", quick), 1)
+    assert not slow.done()
+    release.set()
+    await slow
+    return result
+
+  assert asyncio.run(main()) == "done"
+
+
+def test_a_failed_job_does_not_stop_its_key():
+  async def main():
+    pool = KeyedWorkerPool(concurrency=1, max_pending=100)
+
+    async def fail():
+      raise ValueError("boom")
+
+    async def succeed():
+      return 1
+
+    failed = pool.submit("a", fail)
+    after = pool.submit("a", succeed)
+    with pytest.raises(ValueError):
+      await failed
+    return await after, pool.stats()
+
+  result, stats = asyncio.run(main())
+  assert result == 1
+  assert stats["completed"] == 2
+  assert stats["activeKeys"] == 0
+
+
+def test_close_cancels_queued_jobs():
+  async def main():
+    pool = KeyedWorkerPool(concurrency=1, max_pending=2)
+
+    async def forever():
+      await asyncio.Event().wait()
+
+    running = pool.submit("a", forever)
+    queued = pool.submit("a", forever)
+    assert not pool._has_capacity.is_set()
+    await asyncio.sleep(0)
+    await pool.close()
+    return running, queued, pool.stats()
+
+  running, queued, stats = asyncio.run(main())
+  assert queued.cancelled()
+  assert running.cancelled()
+  assert stats["activeKeys"] == 0